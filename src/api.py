@@ -0,0 +1,251 @@
+"""
+    Python API to generate the models of a dbt project in-process, without
+    argparse or a subprocess per project.
+
+    Unlike the CLI, which works on the project in the working directory, every
+    function takes the project to generate. The parsed models.yml files and
+    run state of a project are held by its Project, not by the process.
+    Nothing is logged.
+
+        from src import api
+
+        result = api.generate_models('/path/to/project', select='staging')
+
+        for model in result.created:
+            print(model.name, model.path)
+
+    Pass a Project (rather than a path) to keep the parsed models.yml files of
+    a project between calls. A Project must not be shared by concurrent calls.
+
+    Some state is shared by every project in the process, none of which
+    changes the generated models:
+
+    - Compiled templates and file name patterns, keyed by their contents, of
+      which only the most recently used are kept (see libs/template.py)
+    - The pool of worker processes parsing models.d/ fragments, which is
+      started on first use and kept for the lifetime of the process
+    - The parsed YAML cache, which is only enabled by the CLI's --yaml-cache
+      and is keyed by absolute file path
+    - The tracer, which is only enabled by the CLI's --trace
+"""
+
+import os
+from dataclasses import dataclass, field
+from typing import Union
+
+from .libs.ownership import OwnershipIndex
+from .libs.project import Project
+from .libs.selector import Selector
+from .libs.sink import create_sink
+from .libs.state import State
+from .model import (OWNED_STATUSES, diff_model, find_models, find_orphans,
+                    ordered_map)
+
+
+@dataclass
+class GeneratedModel:
+    """
+    The result of generating (or comparing) one model
+
+    :param name: Full name of the model (e.g. staging.stg_account)
+    :param path: Path to the model file, relative to the project root
+    :param status: CREATED, SKIPPED or UNCHANGED (from generate_models), or
+        NEW, CHANGED or UNCHANGED (from diff_models)
+    :param diff: Unified diff from the existing model file (from diff_models)
+    """
+
+    name: str
+    path: str
+    status: str
+    diff: str = None
+
+
+@dataclass
+class GenerateResult:
+    """
+    The results of generating (or comparing) the selected models of a project
+
+    :param models: Result of each model, in the order they were generated
+    :param orphaned: Paths (relative to the project root) of the model files
+        which no longer have a template and models.yml entry. Deleted if
+        generate_models was called with prune=True
+    """
+
+    models: list = field(default_factory=list)
+    orphaned: list = field(default_factory=list)
+
+    def with_status(self, status: str) -> list:
+        return [model for model in self.models if model.status == status]
+
+    @property
+    def created(self) -> list:
+        return self.with_status('CREATED')
+
+    @property
+    def skipped(self) -> list:
+        return self.with_status('SKIPPED')
+
+    @property
+    def unchanged(self) -> list:
+        return self.with_status('UNCHANGED')
+
+    @property
+    def new(self) -> list:
+        return self.with_status('NEW')
+
+    @property
+    def changed(self) -> list:
+        return self.with_status('CHANGED')
+
+    @property
+    def counts(self) -> dict:
+        """
+        Number of models by status (e.g. {'created': 2, 'skipped': 1})
+        """
+
+        counts = {}
+        for model in self.models:
+            status = model.status.lower()
+            counts[status] = counts.get(status, 0) + 1
+
+        return counts
+
+
+def get_project(project: Union[str, Project]) -> Project:
+    """
+    Returns the Project for a project root directory
+
+    :param project: Root directory of the dbt project, or a Project
+    """
+
+    return project if isinstance(project, Project) else Project(project)
+
+
+def generate_models(
+        project: Union[str, Project],
+        select: str = None,
+        exclude: str = None,
+        sink=None,
+        overwrite: bool = False,
+        full_refresh: bool = False,
+        prune: bool = False,
+        stream: bool = False,
+        threads: int = 1
+) -> GenerateResult:
+    """
+    Generates the selected models of a project, equivalent to
+    dbtgen model --run (from the project root)
+
+    :param project: Root directory of the dbt project, or a Project
+    :param select: Comma separated node selectors (e.g.
+        staging,!staging.stg_lead)
+    :param exclude: Comma separated node selectors to exclude
+    :param sink: Where model files are written: a sink (e.g. a MemorySink, to
+        collect their contents) or a --sink value. By default, the models
+        directory of the project
+    :param overwrite: If True, overwrite existing model files
+    :param full_refresh: If True, ignore the state of the previous run
+    :param prune: If True, delete the model files which no longer have a
+        template and models.yml entry
+    :param stream: If True, parse models.yml files one model at a time
+    :param threads: Number of worker threads
+    :raises ValueError: If sink is not a sink or --sink value
+    """
+
+    project = get_project(project)
+    selector = Selector(select, exclude)
+    result = GenerateResult()
+
+    owned_sink = sink is None or isinstance(sink, str)
+    if owned_sink:
+        sink = create_sink(sink, project.root_dir)
+
+    # Only files written to the working tree are recorded
+    state = None
+    index = None
+    if sink.persistent:
+        index = OwnershipIndex(project.outputs_index_path, project.root_dir)
+        if not full_refresh:
+            state = State(project.state_file_path, project.root_dir)
+
+    models = find_models(selector, stream=stream, project=project)
+
+    def process(model) -> str:
+        return model.write_file(overwrite, state, sink)
+
+    try:
+        for model, status in ordered_map(process, models, threads):
+            result.models.append(
+                GeneratedModel(model.full_name, model.output_path, status)
+            )
+            if index is not None and status in OWNED_STATUSES:
+                index.record(
+                    os.path.join(model.target_dir, model.file_name),
+                    model.dependencies[0],
+                    model.name
+                )
+            model.clear_contents()
+
+    finally:
+        if owned_sink:
+            sink.close()
+
+    if index is not None:
+        for file_path in find_orphans(index, selector, project=project):
+            rel_path = os.path.relpath(file_path, project.root_dir)
+            result.orphaned.append(rel_path)
+            if prune:
+                # The state is not loaded on a full refresh, but must still
+                # forget pruned files
+                if not state:
+                    state = State(project.state_file_path, project.root_dir)
+                os.remove(file_path)
+                index.remove(file_path)
+                state.remove(file_path)
+
+        index.save()
+
+    if state:
+        state.save()
+
+    return result
+
+
+def diff_models(
+        project: Union[str, Project],
+        select: str = None,
+        exclude: str = None,
+        stream: bool = False,
+        threads: int = 1
+) -> GenerateResult:
+    """
+    Compares the selected models of a project with the existing model files,
+    equivalent to dbtgen model --diff. Nothing is written.
+
+    :param project: Root directory of the dbt project, or a Project
+    :param select: Comma separated node selectors (e.g.
+        staging,!staging.stg_lead)
+    :param exclude: Comma separated node selectors to exclude
+    :param stream: If True, parse models.yml files one model at a time
+    :param threads: Number of worker threads
+    """
+
+    project = get_project(project)
+    selector = Selector(select, exclude)
+    result = GenerateResult()
+
+    models = find_models(selector, stream=stream, project=project)
+
+    for model, (status, diff) in ordered_map(diff_model, models, threads):
+        result.models.append(GeneratedModel(
+            model.full_name, model.output_path, status, ''.join(diff)
+        ))
+        model.clear_contents()
+
+    index = OwnershipIndex(project.outputs_index_path, project.root_dir)
+    result.orphaned = [
+        os.path.relpath(file_path, project.root_dir)
+        for file_path in find_orphans(index, selector, project=project)
+    ]
+
+    return result
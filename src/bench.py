@@ -0,0 +1,351 @@
+"""
+    Benchmarks dbtgen against synthetic projects.
+
+    Creates a synthetic dbt project with a .dbtgen/ tree of a given size, then
+    times start up and the model, package and clean sub-commands against it,
+    each in a separate process. Reports wall time, models per second and peak RSS as
+    JSON, and optionally compares the results against a stored baseline.
+
+    .dbtgen/ tree structure (e.g. --depth 2 --width 2):
+
+        .dbtgen/
+            models.yml
+            d0/
+                d0/
+                    t0_{name}.sql
+                    static_0.sql
+                d1/
+                    ...
+            d1/
+                ...
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from . import params
+from .libs.logger import CustomLogger
+
+logger = CustomLogger()
+
+# Modules which are slow to import and must not be imported on start up
+HEAVY_MODULES = ('dbt', 'snowflake')
+
+# Start up runs the model sub-command with a selector matching no models, so
+# it imports the sub-command's modules and scans .dbtgen/, but generates
+# nothing
+STARTUP_SELECTOR = 'no_such_model'
+
+COMMANDS = {
+    'startup': ['model', '--select', STARTUP_SELECTOR],
+    'model': ['model', '--run', '--overwrite', '--full-refresh'],
+    'model (no-op)': ['model', '--run', '--overwrite'],
+    'package': ['package'],
+    'clean': ['clean'],
+}
+
+
+def generate_project(
+        project_dir: str,
+        depth: int = 2,
+        width: int = 2,
+        templates: int = 2,
+        models: int = 100,
+        static_templates: int = 1
+) -> int:
+    """
+    Creates a synthetic dbt project
+
+    :param project_dir: Directory to create the project in
+    :param depth: Number of nested directory levels in .dbtgen/
+    :param width: Number of sub-directories per directory
+    :param templates: Number of parameterised templates per leaf directory
+    :param models: Number of models defined in models.yml
+    :param static_templates: Number of static (non-parameterised) templates
+        per leaf directory
+    :returns: Number of models which will be generated
+    """
+
+    input_dir = os.path.join(project_dir, '.dbtgen')
+    os.makedirs(input_dir, exist_ok=True)
+
+    with open(os.path.join(input_dir, 'models.yml'), 'w') as f:
+        f.write('models:\n')
+        for i in range(models):
+            f.write(
+                f'  model_{i}:\n'
+                f'    unique_columns:\n'
+                f'      - id_{i}\n'
+                f'      - sys_modified\n'
+            )
+
+    with open(os.path.join(project_dir, 'dbt_project.yml'), 'w') as f:
+        f.write("name: bench\nprofile: bench\n")
+
+    leaf_dirs = ['']
+    for _ in range(depth):
+        leaf_dirs = [
+            os.path.join(leaf_dir, f'd{i}')
+            for leaf_dir in leaf_dirs
+            for i in range(width)
+        ]
+
+    for leaf_dir in leaf_dirs:
+        template_dir = os.path.join(input_dir, leaf_dir)
+        os.makedirs(template_dir, exist_ok=True)
+
+        for i in range(templates):
+            with open(os.path.join(template_dir, f't{i}_{{name}}.sql'), 'w') as f:
+                f.write(
+                    "{{\n    config(\n        materialized='view'\n    )\n}}\n"
+                    "\n"
+                    f"SELECT * FROM {{{{ ref('base_${{name}}') }}}} -- t{i}\n"
+                    "QUALIFY ROW_NUMBER() OVER (\n"
+                    "    PARTITION BY ${unique_columns} ORDER BY 1\n"
+                    ") = 1\n"
+                )
+
+        for i in range(static_templates):
+            with open(os.path.join(template_dir, f'static_{i}.sql'), 'w') as f:
+                f.write(f"SELECT {i} AS id\n")
+
+        # Model properties files, used by the package sub-command
+        properties_dir = os.path.join(project_dir, 'models', leaf_dir)
+        os.makedirs(properties_dir, exist_ok=True)
+        with open(os.path.join(properties_dir, 'properties.yml'), 'w') as f:
+            f.write('version: 2\nmodels:\n')
+            for i in range(models):
+                f.write(f'  - name: properties_model_{i}\n')
+
+    return len(leaf_dirs) * (templates * models + static_templates)
+
+
+def run_command(argv: list = None) -> None:
+    """
+    Entry point used by the benchmark processes. Builds the parser for a
+    single sub-command, including those not enabled in the CLI.
+
+    :param argv: Command line arguments, starting with the sub-command
+    """
+
+    import argparse
+    from . import main
+
+    argv = sys.argv[1:] if argv is None else argv
+    parser = argparse.ArgumentParser(prog='dbtgen')
+    sub_parsers = parser.add_subparsers()
+    getattr(main, f"build_{argv[0].replace('-', '_')}_subparser")(sub_parsers)
+
+    args = parser.parse_args(argv)
+    main.run(args)
+
+
+def parse_import_times(stderr: str) -> dict:
+    """
+    Parses the output of python -X importtime
+
+    :param stderr: Standard error of the process
+    :returns: Import time (milliseconds) of dbtgen, including the modules
+        imported lazily by the sub-command, and any heavy modules imported
+    """
+
+    import_time = 0
+    heavy_imports = set()
+
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+
+        _, cumulative, module = line[len('import time:'):].split('|')
+        # Modules imported by another are indented beneath it, so only
+        # top level imports are counted towards the import time of dbtgen
+        top_level = not module.startswith('  ')
+        module = module.strip()
+
+        if top_level and module.split('.')[0] == 'src':
+            import_time += int(cumulative) / 1000
+        if module.split('.')[0] in HEAVY_MODULES:
+            heavy_imports.add(module.split('.')[0])
+
+    return {
+        'import_time_ms': round(import_time, 3),
+        'heavy_imports': sorted(heavy_imports)
+    }
+
+
+def time_command(
+        argv: list,
+        project_dir: str,
+        startup: bool = False
+) -> dict:
+    """
+    Runs a dbtgen sub-command in a separate process
+
+    :param argv: Command line arguments, starting with the sub-command
+    :param project_dir: Working directory (the dbt project)
+    :param startup: If True, also record module import times
+    :returns: Wall time (seconds) and peak RSS (MB) of the process
+    """
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [os.path.dirname(params.MODULE_DIR), env.get('PYTHONPATH', '')]
+    )
+
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            *(['-X', 'importtime'] if startup else []),
+            '-c',
+            'from src.bench import run_command; run_command()',
+            *argv
+        ],
+        cwd=project_dir,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE
+    )
+    stderr = process.stderr.read()
+    # Reap the process with wait4 for its own resource usage, as that of all
+    # children (RUSAGE_CHILDREN) is the peak of every command run so far
+    _, status, rusage = os.wait4(process.pid, 0)
+    wall_time = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    if process.returncode != 0:
+        raise RuntimeError(
+            f"dbtgen {' '.join(argv)} failed:\n{stderr.decode()}"
+        )
+
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    peak_rss = rusage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin'
+                                   else 1024)
+
+    result = {'wall_time': wall_time, 'peak_rss_mb': peak_rss}
+    if startup:
+        result.update(parse_import_times(stderr.decode()))
+
+    return result
+
+
+def run_benchmark(
+        scenario: dict,
+        repeat: int = 1
+) -> dict:
+    """
+    Generates a synthetic project and times each command against it. The
+    fastest of the repeated runs is reported.
+
+    :param scenario: Keyword arguments for generate_project
+    :param repeat: Number of times to run each command
+    :returns: Results by command
+    """
+
+    results = {}
+
+    with tempfile.TemporaryDirectory(prefix='dbtgen-bench-') as project_dir:
+        model_count = generate_project(project_dir, **scenario)
+
+        for command, argv in COMMANDS.items():
+            runs = []
+            for _ in range(repeat):
+                runs.append(
+                    time_command(argv, project_dir, command == 'startup')
+                )
+
+            result = min(runs, key=lambda r: r['wall_time'])
+            result['peak_rss_mb'] = max(r['peak_rss_mb'] for r in runs)
+            if command.startswith('model'):
+                result['models'] = model_count
+                result['models_per_second'] = \
+                    model_count / result['wall_time']
+
+            results[command] = result
+
+    return results
+
+
+def compare_to_baseline(
+        results: dict,
+        baseline: dict,
+        budget: float
+) -> list:
+    """
+    Compares results against a baseline
+
+    :param results: Results by command
+    :param baseline: Results by command from a previous run
+    :param budget: Maximum allowed ratio to the baseline (e.g. 1.2 allows
+        commands to be 20% slower, or use 20% more memory)
+    :returns: Descriptions of the budgets exceeded, including any slow to 
+        import modules (e.g. dbt) imported on start up
+    """
+
+    exceeded = []
+
+    for command, result in results.items():
+        if result.get('heavy_imports'):
+            exceeded.append(
+                f"{command} imports {', '.join(result['heavy_imports'])}"
+            )
+
+        for metric in ['wall_time', 'peak_rss_mb']:
+            base = baseline.get(command, {}).get(metric)
+            if base and result[metric] > base * budget:
+                exceeded.append(
+                    f'{command} {metric}: {result[metric]:.3f} > '
+                    f'{base:.3f} x {budget}'
+                )
+
+    return exceeded
+
+
+def main(args):
+
+    scenario = {
+        'depth': args.depth,
+        'width': args.width,
+        'templates': args.templates,
+        'models': args.models,
+        'static_templates': args.static_templates
+    }
+    logger.info(f"Running benchmark: {scenario}")
+
+    results = run_benchmark(scenario, args.repeat)
+    report = json.dumps(
+        {'scenario': scenario, 'results': results},
+        indent=2
+    )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+    else:
+        print(report)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+
+        if baseline.get('scenario') != scenario:
+            logger.warning('[WARNING] Baseline was recorded for a different '
+                        f"scenario: {baseline.get('scenario')}")
+
+        exceeded = compare_to_baseline(
+            results,
+            baseline.get('results', {}),
+            args.budget
+        )
+
+        for message in exceeded:
+            logger.status(message, 'FAILED')
+
+        if exceeded:
+            sys.exit(1)
+
+        logger.status('Performance budget', 'DONE')
@@ -1,6 +1,17 @@
+import os
+import tempfile
+import threading
 from os import listdir
 
+from .tracer import tracer
 
+# The umask can only be read by setting it, so read it once on import rather
+# than from worker threads
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+@tracer.traced('io')
 def read_file(
         file_path: str,
         allow_empty: bool = True
@@ -22,6 +33,115 @@ def read_file(
     return contents
 
 
+@tracer.traced('io')
+def write_file(
+        file_path: str,
+        contents: str,
+        exists: bool = True
+) -> bool:
+    """
+    Writes a string to a file, only if it differs from the contents already on
+    disk, so that unchanged files keep their modification time (and e.g. dbt
+    partial parsing is not invalidated).
+
+    The contents are written to a temporary file in the same directory and 
+    moved into place with os.replace, so the file is never seen half written.
+
+    :param file_path: Path to the local file
+    :param contents: Contents to write
+    :param exists: False if the file is already known not to exist, which 
+        skips reading it
+    :returns: True if the file was written, False if it was unchanged
+    """
+
+    data = contents.encode('utf-8')
+    mode = 0o666 & ~_UMASK
+
+    if exists:
+        try:
+            with open(file_path, 'rb') as f:
+                if f.read() == data:
+                    return False
+                mode = os.fstat(f.fileno()).st_mode & 0o777
+        except FileNotFoundError:
+            pass
+
+    dir_path = os.path.dirname(file_path) or '.'
+    fd, tmp_path = tempfile.mkstemp(
+        dir=dir_path,
+        prefix=f'.{os.path.basename(file_path)}.',
+        suffix='.tmp'
+    )
+
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+    return True
+
+
+class WritePlanner:
+    """
+    Tracks the target directories of a bulk write, so that each directory is
+    created (or listed) once, rather than checking whether the directory and
+    each file exist for every file written. Safe to use from worker threads.
+    """
+
+    def __init__(self):
+        self._dirs = {}
+        self._lock = threading.Lock()
+
+    def prepare(self, dir_path: str) -> set:
+        """
+        Creates a directory if it does not exist, otherwise lists it. Only the
+        first call for each directory touches the file system.
+
+        :param dir_path: Path to the target directory
+        :returns: Names of the files in the directory
+        """
+
+        with self._lock:
+            if dir_path not in self._dirs:
+                try:
+                    self._dirs[dir_path] = set(listdir(dir_path))
+                except FileNotFoundError:
+                    os.makedirs(dir_path, exist_ok=True)
+                    self._dirs[dir_path] = set()
+
+            return self._dirs[dir_path]
+
+    def exists(self, file_path: str) -> bool:
+        """
+        Whether a file exists, using the listing of its directory
+
+        :param file_path: Path to the target file
+        """
+
+        dir_path, file_name = os.path.split(file_path)
+        return file_name in self.prepare(dir_path)
+
+    def add(self, file_path: str) -> None:
+        """
+        Records a file created since its directory was listed
+
+        :param file_path: Path to the target file
+        """
+
+        dir_path, file_name = os.path.split(file_path)
+        files = self.prepare(dir_path)
+
+        with self._lock:
+            files.add(file_name)
+
+
 def list_files_in_dir(
         path: str,
         filter_extension: str = None,
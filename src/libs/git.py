@@ -0,0 +1,46 @@
+import os
+import subprocess
+
+
+def _git(*args, cwd: str = None) -> str:
+    try:
+        result = subprocess.run(
+            ['git', *args],
+            cwd=cwd,
+            capture_output=True,
+            text=True,
+            check=True
+        )
+    except FileNotFoundError:
+        raise RuntimeError('git executable not found')
+    except subprocess.CalledProcessError as err:
+        raise RuntimeError(
+            f"git {' '.join(args)} failed: {err.stderr.strip()}"
+        )
+
+    return result.stdout
+
+
+def changed_files(ref: str, cwd: str = None) -> set:
+    """
+    Returns the files changed since a git ref, using the local git binary
+    only (no fetch). Changes are taken from the merge base of the ref and
+    HEAD, so that changes made on the ref since the branch was created are
+    not included. Uncommitted and untracked files are included.
+
+    :param ref: Git ref to compare to (e.g. origin/main)
+    :param cwd: Directory within the git repository
+    :returns: Absolute paths of the changed files
+    """
+
+    top_level = _git('rev-parse', '--show-toplevel', cwd=cwd).strip()
+    merge_base = _git('merge-base', ref, 'HEAD', cwd=top_level).strip()
+
+    names = _git(
+        'diff', '--name-only', '--no-renames', merge_base, cwd=top_level
+    ).splitlines()
+    names += _git(
+        'ls-files', '--others', '--exclude-standard', cwd=top_level
+    ).splitlines()
+
+    return {os.path.join(top_level, name) for name in names if name}
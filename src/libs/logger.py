@@ -1,8 +1,48 @@
+import atexit
 import logging
+import logging.handlers
+import queue
+import sys
+import time
+from typing import Iterable, TextIO
+
+# Log records are queued by the calling thread and written to the console by
+# a single listener thread, so worker threads never block on console I/O
+_console_handler = logging.StreamHandler()
+_console_handler.setFormatter(
+    logging.Formatter(fmt='%(asctime)s | %(message)s', datefmt='%H:%M:%S')
+)
+_queue = queue.Queue()
+_queue_handler = logging.handlers.QueueHandler(_queue)
+_listener = logging.handlers.QueueListener(_queue, _console_handler)
+_listener.start()
+atexit.register(_listener.stop)
+
+
+def flush() -> None:
+    """
+    Blocks until every queued log record has been written to the console
+    """
+
+    _queue.join()
+
+
+def _write(lines: Iterable[str]) -> None:
+    """
+    Writes lines straight to the console, after any queued log records
+    """
+
+    flush()
+    with _console_handler.lock:
+        _console_handler.stream.writelines(lines)
+        _console_handler.flush()
 
 
 class CustomLogger(logging.getLoggerClass()):
 
+    # If True, statuses other than FAILED are not logged (set by --quiet)
+    quiet = False
+
     def __init__(self):
         super().__init__('logger')
 
@@ -10,14 +50,10 @@ class CustomLogger(logging.getLoggerClass()):
             'fmt': '%(asctime)s | %(message)s',
             'datefmt': '%H:%M:%S',
         }
-        formatter = logging.Formatter(**self.format)
 
         self.setLevel(logging.INFO)
         self.handlers = []
-
-        handler = logging.StreamHandler()
-        handler.setFormatter(formatter)
-        self.addHandler(handler)
+        self.addHandler(_queue_handler)
 
     def status(
             self,
@@ -25,17 +61,23 @@ class CustomLogger(logging.getLoggerClass()):
             status: str
     ) -> None:
         """
-        Logs a message to the terminal with a status. Formats message with 
+        Logs a message to the terminal with a status. Formats message with
         trailing '...'
 
         :param message: The text to be formatted and displayed to the terminal
         :param status: A flag to indicate the status
         """
+        if self.quiet and status != 'FAILED':
+            return
+
         colours = {
             'RUN': '',
             'DONE': '\033[92m',
             'CREATED': '\033[92m',
             'SKIPPED' : '\033[93m',
+            'UNCHANGED': '\033[93m',
+            'ORPHANED': '\033[93m',
+            'PRUNED': '\033[93m',
             'FAILED': '\033[91m'
         }
         reset = '\x1b[0m'
@@ -44,3 +86,114 @@ class CustomLogger(logging.getLoggerClass()):
             f"{message} {(80 - len(message)) * '.'} "
             f"[{colours.get(status) + status + reset}]"
         )
+
+    def stream(self, lines: Iterable[str]) -> None:
+        """
+        Writes lines straight to the console, without building a single
+        message. Used for large outputs (e.g. compiled models).
+
+        :param lines: Lines of text, including line endings
+        """
+
+        _write(lines)
+
+
+class Progress:
+    """
+    Reports progress as a single line, updated in place, showing the number
+    of items processed, throughput and estimated time remaining. Used in
+    place of a status line per item. Where the console is not a terminal
+    (e.g. CI logs), a new line is written every few seconds instead.
+
+    :param total: Number of items to process, if known
+    :param unit: Name of the items (e.g. models)
+    :param stream: Stream the console handler writes to
+    """
+
+    def __init__(
+            self,
+            total: int = None,
+            unit: str = 'models',
+            stream: TextIO = None
+    ):
+        self.total = total
+        self.unit = unit
+        self.count = 0
+        self.statuses = {}
+
+        stream = stream or _console_handler.stream or sys.stderr
+        self.tty = hasattr(stream, 'isatty') and stream.isatty()
+        self.interval = 0.2 if self.tty else 5.0
+
+        self._start = time.perf_counter()
+        self._last_write = self._start
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._start
+
+    @property
+    def rate(self) -> float:
+        return self.count / self.elapsed if self.elapsed else 0.0
+
+    def line(self) -> str:
+        """
+        Returns the progress line (e.g. 120/400 models (30%) |
+        850.0 models/s | ETA 0:00:01)
+        """
+
+        if self.total:
+            line = f'{self.count}/{self.total} {self.unit} ' \
+                f'({self.count / self.total:.0%})'
+        else:
+            line = f'{self.count} {self.unit}'
+
+        line += f' | {self.rate:.1f} {self.unit}/s'
+
+        if self.total and self.rate:
+            remaining = int((self.total - self.count) / self.rate)
+            line += f' | ETA {remaining // 3600}:{remaining // 60 % 60:02d}:' \
+                f'{remaining % 60:02d}'
+
+        if self.statuses:
+            line += ' | ' + ', '.join(
+                f'{status.lower()} {count}'
+                for status, count in self.statuses.items()
+            )
+
+        return line
+
+    def _draw(self, final: bool = False) -> None:
+        if self.tty:
+            _write(['\r\033[K', self.line(), '\n' if final else ''])
+        else:
+            _write([f'{self.line()}\n'])
+
+    def update(self, status: str = None) -> None:
+        """
+        Records an item as processed, redrawing the line at most every
+        interval
+
+        :param status: The status of the item (e.g. CREATED, SKIPPED)
+        """
+
+        self.count += 1
+        if status:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+
+        now = time.perf_counter()
+        if now - self._last_write >= self.interval:
+            self._last_write = now
+            self._draw()
+
+    def close(self) -> str:
+        """
+        Draws the final line
+
+        :returns: Summary of the total time and throughput
+        """
+
+        self._draw(final=True)
+
+        return f'Processed {self.count} {self.unit} in {self.elapsed:.2f}s ' \
+            f'({self.rate:.1f} {self.unit}/s)'
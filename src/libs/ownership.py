@@ -0,0 +1,132 @@
+import json
+import os
+
+INDEX_VERSION = 1
+
+
+class OwnershipIndex:
+    """
+    Persisted record of the model files generated by dbtgen, and the
+    template and models.yml entry each one was generated from. Used to find
+    generated files which no longer have a source (e.g. after an entry is
+    removed from models.yml or a template is renamed), without guessing from
+    the contents of the models directory.
+
+    Runs only update the entries of the models they generate, so runs of a
+    selection of the tree (or a shard) keep the entries of other models.
+
+    The index file has the following structure:
+
+        {
+            "version": 1,
+            "outputs": {
+                "<output path, relative to the project root>": {
+                    "template": "<template path, relative to the project root>",
+                    "model": "<model name>"
+                }
+            }
+        }
+
+    :param file_path: Path to the index file (e.g. .dbtgen/.outputs.json)
+    :param root_dir: Directory that paths are recorded relative to
+    """
+
+    def __init__(self, file_path: str, root_dir: str):
+        self.file_path = file_path
+        self.root_dir = root_dir
+        self.outputs = {}
+        # Whether any entry changed since the index was loaded
+        self._dirty = False
+
+        try:
+            with open(file_path, 'r') as f:
+                contents = json.load(f)
+            if contents.get('version') == INDEX_VERSION:
+                self.outputs = contents.get('outputs', {})
+
+        except (FileNotFoundError, ValueError):
+            pass
+
+    def _key(self, path: str) -> str:
+        return os.path.relpath(path, self.root_dir)
+
+    def record(
+            self,
+            output_path: str,
+            template_path: str,
+            model_name: str
+    ) -> None:
+        """
+        Records the source of a generated model file
+
+        :param output_path: Path to the generated model file
+        :param template_path: Path to the template it was generated from
+        :param model_name: Name of the models.yml entry (or the template file
+            name, for templates without variables)
+        """
+
+        entry = {'template': self._key(template_path), 'model': model_name}
+        key = self._key(output_path)
+
+        if self.outputs.get(key) != entry:
+            self.outputs[key] = entry
+            self._dirty = True
+
+    def update(self, entries: dict) -> None:
+        """
+        Records the entries of another index (e.g. of a shard)
+
+        :param entries: Entries by output path, relative to the root directory
+        """
+
+        for key, entry in entries.items():
+            if self.outputs.get(key) != entry:
+                self.outputs[key] = entry
+                self._dirty = True
+
+    def remove(self, output_path: str) -> None:
+        """
+        Forgets a model file, e.g. once it has been deleted
+
+        :param output_path: Path to the generated model file
+        """
+
+        if self.outputs.pop(self._key(output_path), None) is not None:
+            self._dirty = True
+
+    def owned(self) -> list:
+        """
+        Returns the recorded model files
+
+        :returns: (output path, template path, model name) tuples, with
+            absolute paths
+        """
+
+        return [
+            (
+                os.path.join(self.root_dir, output),
+                os.path.join(self.root_dir, owner['template']),
+                owner['model']
+            )
+            for output, owner in sorted(self.outputs.items())
+        ]
+
+    def save(self) -> None:
+        """
+        Writes the index to disk, if any entry changed. Written without
+        indentation, so that the C encoder of the json module is used.
+        """
+
+        if not self._dirty:
+            return
+
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+
+        with open(self.file_path, 'w') as f:
+            f.write(json.dumps(
+                {'version': INDEX_VERSION, 'outputs': self.outputs},
+                separators=(',', ':'),
+                sort_keys=True
+            ))
+
+        self._dirty = False
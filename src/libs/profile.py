@@ -1,10 +1,20 @@
-import snowflake.connector
-from dbt.cli.resolvers import default_profiles_dir
-from dbt.utils import get_profile_from_project
+from functools import lru_cache
 
 from .yaml_handler import read_yaml_file
 
-PROFILES = read_yaml_file(f"{default_profiles_dir()}/profiles.yml")
+# snowflake.connector and dbt are slow to import, so they are only imported
+# when a connection is made, rather than when the CLI starts
+
+
+@lru_cache(maxsize=None)
+def get_profiles() -> dict:
+    """
+    Reads the local dbt profiles.yml (once)
+    """
+
+    from dbt.cli.resolvers import default_profiles_dir
+
+    return read_yaml_file(f"{default_profiles_dir()}/profiles.yml")
 
 
 def get_profile_name_from_current_project():
@@ -12,20 +22,27 @@ def get_profile_name_from_current_project():
 
 
 def get_credentials(profile: str):
+    from dbt.utils import get_profile_from_project
+
     return get_profile_from_project(
-        PROFILES[profile]
+        get_profiles()[profile]
     )
 
 
-def snowflake_connect(profile_name):
+def snowflake_connect(profile_name: str = None):
     """
     Reads the dbt profiles.yml stored locally, selects credentials for a given 
     profile and creates a Snowflake connection object
 
-    :param profile_name: Name of the profile to use
+    :param profile_name: Name of the profile to use (by default, the profile 
+        of the dbt project in the current directory)
     :returns: Snowflake connection object
     """
 
-    sf_creds = get_credentials(profile_name)
+    import snowflake.connector
+
+    sf_creds = get_credentials(
+        profile_name or get_profile_name_from_current_project()
+    )
     
     return snowflake.connector.connect(**sf_creds)
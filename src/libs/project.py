@@ -0,0 +1,42 @@
+import os
+
+from .resolver import LayeredYamlResolver
+
+
+class Project:
+    """
+    Paths of a dbt project and its .dbtgen tree, and the variables file
+    resolvers which cache the parsed models.yml and ignore.yml files of the
+    tree. Holds all of the state of generating models for a project, so that
+    several projects can be generated in one process.
+
+    :param root_dir: Root directory of the dbt project
+    """
+
+    def __init__(self, root_dir: str):
+        self.root_dir = os.path.abspath(root_dir)
+        self.input_dir = os.path.join(self.root_dir, '.dbtgen', '')
+        self.target_dir = os.path.join(self.root_dir, 'models')
+        self.state_file_path = os.path.join(self.input_dir, '.state.json')
+        self.outputs_index_path = os.path.join(self.input_dir, '.outputs.json')
+        self.shards_dir = os.path.join(self.input_dir, '.shards')
+        self.resolvers = {}
+
+    def get_resolver(
+            self,
+            models_file: str = 'models.yml'
+    ) -> LayeredYamlResolver:
+        """
+        Returns the resolver for a variables file (e.g. models.yml,
+        ignore.yml), which is kept for the lifetime of the project
+
+        :param models_file: Name of the variables file
+        """
+
+        if models_file not in self.resolvers:
+            self.resolvers[models_file] = LayeredYamlResolver(
+                self.input_dir,
+                models_file
+            )
+
+        return self.resolvers[models_file]
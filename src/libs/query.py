@@ -0,0 +1,142 @@
+import time
+from collections import deque
+from typing import Callable, Iterator, Tuple
+
+import snowflake.connector
+
+from .logger import CustomLogger
+
+logger = CustomLogger()
+
+# Number of objects per UNION query
+CHUNK_SIZE = 100
+# Number of chunk queries running in the warehouse at once
+PARALLEL_QUERIES = 4
+# Seconds between checks of the status of running queries
+POLL_INTERVAL = 0.5
+
+
+def chunks(items: list, size: int) -> Iterator[list]:
+    """
+    Splits a list into chunks of at most size items
+    """
+
+    size = max(size, 1)
+
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def cancel_query(con, query_id: str) -> None:
+    """
+    Cancels a running query, ignoring queries which have already finished
+    """
+
+    try:
+        with con.cursor() as cur:
+            cur.execute(f"SELECT SYSTEM$CANCEL_QUERY('{query_id}')")
+    except snowflake.connector.errors.Error as err:
+        logger.warning(f'[WARNING] Could not cancel query {query_id}: {err}')
+
+
+def execute_chunked(
+    con,
+    build_query: Callable[[list], str],
+    objects: list,
+    chunk_size: int = CHUNK_SIZE,
+    parallel: int = PARALLEL_QUERIES,
+    timeout: float = None,
+    cursor_class=None,
+    failed_rows: Callable[[list], list] = None,
+    sort_key: Callable = None
+) -> Tuple[list, list]:
+    """
+    Runs a query over a list of objects (e.g. a UNION with one SELECT per
+    table) as chunks of at most chunk_size objects. Chunks are submitted
+    asynchronously, each from its own cursor, and polled, with at most
+    parallel chunks running at once, so no single statement grows with the
+    number of objects. A chunk which fails (for any connector error) or times
+    out (and is cancelled) does not stop the other chunks. Running chunks are
+    cancelled if the run is interrupted.
+
+    Chunks complete in any order, and the rows of a UNION are unordered, so
+    rows are returned in the order the chunks were submitted (sorted by
+    sort_key within each chunk), with the rows of a failed chunk in its
+    place. Generated files then only change when the results do.
+
+    :param con: Snowflake connection
+    :param build_query: Function returning the query for a chunk of objects
+    :param objects: Objects to query
+    :param chunk_size: Maximum number of objects per query
+    :param parallel: Maximum number of queries running at once
+    :param timeout: Seconds after which a running query is cancelled
+    :param cursor_class: Cursor class of the results (e.g. DictCursor)
+    :param failed_rows: Function returning the rows to use for the objects of
+        a failed chunk (by default, none)
+    :param sort_key: Key to sort the rows of each chunk by
+    :returns: Rows of every chunk, and the (objects, error message) of every
+        failed chunk
+    """
+
+    pending = deque(enumerate(chunks(objects, chunk_size)))
+    running = {}
+    results = [[] for _ in range(len(pending))]
+    failures = []
+    cursor_args = (cursor_class,) if cursor_class else ()
+
+    def fail(index: int, chunk: list, error: str) -> None:
+        failures.append((chunk, error))
+        results[index] = failed_rows(chunk) if failed_rows else []
+
+    def finish(query_id: str, error: str = None) -> None:
+        index, chunk, _, cur = running.pop(query_id)
+        if error is None:
+            try:
+                con.get_query_status_throw_if_error(query_id)
+                cur.get_results_from_sfqid(query_id)
+                results[index] = sorted(cur.fetchall(), key=sort_key) \
+                    if sort_key else cur.fetchall()
+            except snowflake.connector.errors.Error as err:
+                error = str(err)
+        if error is not None:
+            fail(index, chunk, error)
+        cur.close()
+
+    try:
+        while pending or running:
+
+            while pending and len(running) < max(parallel, 1):
+                index, chunk = pending.popleft()
+                cur = con.cursor(*cursor_args)
+                try:
+                    cur.execute_async(build_query(chunk))
+                    running[cur.sfqid] = (index, chunk, time.monotonic(), cur)
+                except snowflake.connector.errors.Error as err:
+                    fail(index, chunk, str(err))
+                    cur.close()
+
+            for query_id, (_, _, started, _) in list(running.items()):
+                try:
+                    still_running = con.is_still_running(
+                        con.get_query_status(query_id)
+                    )
+                except snowflake.connector.errors.Error as err:
+                    finish(query_id, str(err))
+                    continue
+
+                if not still_running:
+                    finish(query_id)
+                elif timeout and time.monotonic() - started > timeout:
+                    cancel_query(con, query_id)
+                    finish(query_id, f'Cancelled after {timeout}s')
+
+            if running:
+                time.sleep(POLL_INTERVAL)
+
+    except BaseException:
+        for query_id, (_, _, _, cur) in running.items():
+            cancel_query(con, query_id)
+            cur.close()
+        raise
+
+    return [row for rows in results for row in rows], failures
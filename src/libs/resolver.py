@@ -0,0 +1,317 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from .yaml_handler import deep_merge, read_yaml_file
+
+_NO_VARIABLES = {}
+
+# Fragments are parsed in a process pool once there are enough of them to
+# outweigh the cost of sending the parsed contents back
+PARALLEL_FRAGMENTS = 4
+FRAGMENT_EXTENSIONS = ('.yml', '.yaml')
+
+_pool = None
+
+
+def fragment_dir_name(file_name: str) -> str:
+    """
+    Returns the name of the directory of fragments of a variable file (e.g.
+    models.d for models.yml)
+    """
+
+    return f'{os.path.splitext(file_name)[0]}.d'
+
+
+def parse_yaml_files(file_paths: list) -> list:
+    """
+    Parses YAML files, using a pool of processes (one per core) when there
+    are enough files to parse
+
+    :param file_paths: Paths to the .yml files
+    :returns: Parsed contents of each file, in the same order
+    """
+
+    global _pool
+
+    if len(file_paths) < PARALLEL_FRAGMENTS or (os.cpu_count() or 1) < 2:
+        return [read_yaml_file(file_path) for file_path in file_paths]
+
+    if _pool is None:
+        _pool = ProcessPoolExecutor()
+
+    return list(_pool.map(read_yaml_file, file_paths))
+
+
+def merge_fragments(fragments: list) -> dict:
+    """
+    Merges the contents of a variable file and its fragments into one layer.
+    Each model (or other top level key) may only be defined in one file.
+
+    :param fragments: (file path, parsed contents) pairs, in merge order
+    :raises ValueError: If a key is defined in more than one file
+    """
+
+    merged = {}
+    origins = {}
+
+    for file_path, contents in fragments:
+        for key, value in (contents or {}).items():
+
+            if value is None:
+                continue
+
+            if isinstance(value, dict) and isinstance(merged.get(key), dict):
+                for name, variables in value.items():
+                    if name in merged[key]:
+                        raise ValueError(
+                            f"Duplicate key '{key}.{name}' defined in both "
+                            f"{origins[(key, name)]} and {file_path}"
+                        )
+                    merged[key][name] = variables
+                    origins[(key, name)] = file_path
+
+            elif key in merged:
+                raise ValueError(
+                    f"Duplicate key '{key}' defined in both "
+                    f"{origins[(key,)]} and {file_path}"
+                )
+
+            else:
+                merged[key] = dict(value) if isinstance(value, dict) else value
+                origins[(key,)] = file_path
+                if isinstance(value, dict):
+                    for name in value:
+                        origins[(key, name)] = file_path
+
+    return merged
+
+
+class LayeredYamlResolver:
+    """
+    Resolves the variable file (e.g. models.yml or ignore.yml) which applies 
+    to a directory of the .dbtgen tree.
+
+    Files are layered from the root directory down to the selected directory,
+    with each nested file deep merged over those of its parent directories, so
+    nested directories only need to override the keys they change.
+
+    A directory's layer may also be split into fragments: any number of YAML
+    files in a directory named after the variable file (e.g. models.d/ for 
+    models.yml), merged with the variable file in name order. Each model may
+    only be defined in one of them.
+
+    Each file is parsed at most once, and re-parsed only if its modification
+    time or size changes, so a resolver can be reused across runs. File stats
+    already known from scanning the tree can be provided with set_stat (and
+    set_fragments), to avoid stat calls for every layer of every directory.
+
+    :param root_dir: Top level directory of the tree (e.g. .dbtgen/)
+    :param file_name: Name of the variable file (e.g. models.yml)
+    """
+
+    def __init__(self, root_dir: str, file_name: str = 'models.yml'):
+        self.root_dir = os.path.abspath(root_dir)
+        self.file_name = file_name
+        self.fragment_dir_name = fragment_dir_name(file_name)
+        self._files = {}
+        self._layers = {}
+        self._dirs = {}
+        self._stats = {}
+        self._fragments = {}
+
+    def set_stat(self, file_path: str, stat: os.stat_result = None) -> None:
+        """
+        Records the stat of a variable file, or None if it does not exist
+
+        :param file_path: Path to the variable file
+        :param stat: Result of os.stat (e.g. from os.DirEntry.stat)
+        """
+
+        self._stats[os.path.abspath(file_path)] = stat
+
+    def set_fragments(self, dir_path: str, entries: list) -> None:
+        """
+        Records the fragments of a directory's variable file, found when 
+        scanning the tree
+
+        :param dir_path: Path to the directory containing the fragments 
+            directory (e.g. the parent of models.d/)
+        :param entries: os.DirEntry of each fragment
+        """
+
+        self._fragments[os.path.abspath(dir_path)] = sorted(
+            os.path.abspath(entry.path) for entry in entries
+        )
+        for entry in entries:
+            self.set_stat(entry.path, entry.stat())
+
+    def clear_stats(self) -> None:
+        """
+        Forgets recorded file stats, e.g. before reusing the resolver for 
+        another run
+        """
+
+        self._stats.clear()
+        self._fragments.clear()
+
+    def fragments(self, dir_path: str) -> list:
+        """
+        Returns the paths of the fragments of a directory's variable file, in
+        name order
+
+        :param dir_path: Path to a directory within the root directory
+        """
+
+        dir_path = os.path.abspath(dir_path)
+
+        if dir_path not in self._fragments:
+            fragment_dir = os.path.join(dir_path, self.fragment_dir_name)
+            try:
+                self._fragments[dir_path] = sorted(
+                    os.path.join(fragment_dir, name)
+                    for name in os.listdir(fragment_dir)
+                    if name.endswith(FRAGMENT_EXTENSIONS)
+                    and not name.startswith('.')
+                )
+            except (FileNotFoundError, NotADirectoryError):
+                self._fragments[dir_path] = []
+
+        return self._fragments[dir_path]
+
+    def _stat(self, file_path: str):
+        if file_path in self._stats:
+            return self._stats[file_path]
+        try:
+            return os.stat(file_path)
+        except FileNotFoundError:
+            return None
+
+    def _signature(self, file_path: str):
+        stat = self._stat(file_path)
+        return None if stat is None else (stat.st_mtime_ns, stat.st_size)
+
+    def load(self, file_path: str):
+        """
+        Returns the parsed contents of a single variable file, or None if the
+        file does not exist
+
+        :param file_path: Path to the variable file
+        """
+
+        return self.load_files([file_path])[0]
+
+    def load_files(self, file_paths: list) -> list:
+        """
+        Returns the parsed contents of variable files (None for any file 
+        which does not exist). Only new or modified files are parsed, in 
+        parallel when there are enough of them.
+
+        :param file_paths: Paths to the variable files
+        """
+
+        file_paths = [os.path.abspath(file_path) for file_path in file_paths]
+        signatures = {}
+        stale = []
+
+        for file_path in file_paths:
+            signature = self._signature(file_path)
+            signatures[file_path] = signature
+
+            if signature is None:
+                self._files.pop(file_path, None)
+            elif file_path not in self._files \
+                    or self._files[file_path][0] != signature:
+                stale.append(file_path)
+
+        for file_path, contents in zip(stale, parse_yaml_files(stale)):
+            self._files[file_path] = (signatures[file_path], contents or {})
+
+        return [
+            self._files[file_path][1] if signatures[file_path] else None
+            for file_path in file_paths
+        ]
+
+    def load_layer(self, dir_path: str):
+        """
+        Returns the variables defined in a directory: its variable file 
+        merged with any fragments, or None if there are neither
+
+        :param dir_path: Path to a directory within the root directory
+        :raises ValueError: If a model is defined in more than one file
+        """
+
+        dir_path = os.path.abspath(dir_path)
+        file_path = os.path.join(dir_path, self.file_name)
+        fragments = self.fragments(dir_path)
+
+        if not fragments:
+            return self.load(file_path)
+
+        file_paths = [file_path, *fragments]
+        contents = self.load_files(file_paths)
+        signature = [
+            (path, self._files[path][0]) for path, parsed
+            in zip(file_paths, contents) if parsed is not None
+        ]
+
+        cached = self._layers.get(dir_path)
+        if cached and cached[0] == signature:
+            return cached[1]
+
+        layer = merge_fragments([
+            (path, parsed) for path, parsed in zip(file_paths, contents)
+            if parsed is not None
+        ])
+        self._layers[dir_path] = (signature, layer)
+
+        return layer
+
+    def layers(self, dir_path: str) -> list:
+        """
+        Returns the paths of the variable files (and fragments) merged for a
+        directory, from the root directory down
+
+        :param dir_path: Path to a directory within the root directory
+        """
+
+        dir_path = os.path.abspath(dir_path)
+        layers = []
+
+        while True:
+            layers.extend(reversed(self.fragments(dir_path)))
+            file_path = os.path.join(dir_path, self.file_name)
+            if self._stat(file_path) is not None:
+                layers.append(file_path)
+
+            if dir_path == self.root_dir or os.path.commonpath(
+                    [dir_path, self.root_dir]) != self.root_dir:
+                break
+            dir_path = os.path.dirname(dir_path)
+
+        return layers[::-1]
+
+    def resolve(self, dir_path: str) -> dict:
+        """
+        Returns the merged variables for a directory
+
+        :param dir_path: Path to a directory within the root directory
+        """
+
+        dir_path = os.path.abspath(dir_path)
+
+        if dir_path == self.root_dir \
+                or os.path.commonpath([dir_path, self.root_dir]) != self.root_dir:
+            parent = _NO_VARIABLES
+        else:
+            parent = self.resolve(os.path.dirname(dir_path))
+
+        layer = self.load_layer(dir_path)
+
+        cached = self._dirs.get(dir_path)
+        if cached and cached[0] is parent and cached[1] is layer:
+            return cached[2]
+
+        resolved = deep_merge(parent, layer) if layer else parent
+        self._dirs[dir_path] = (parent, layer, resolved)
+
+        return resolved
@@ -0,0 +1,152 @@
+import os
+from dataclasses import dataclass, field
+from typing import Iterator
+
+from .resolver import FRAGMENT_EXTENSIONS, fragment_dir_name
+from .selector import Selector
+from .tracer import tracer
+
+VARIABLE_FILES = ('models.yml', 'ignore.yml')
+FRAGMENT_DIRS = {fragment_dir_name(file_name): file_name
+                 for file_name in VARIABLE_FILES}
+
+
+@dataclass
+class ScannedDir:
+    """
+    A directory of the .dbtgen tree, with the template and variable files it
+    contains.
+
+    :param path: Path to the directory
+    :param rel_path: Path relative to the root of the tree
+    :param namespace: Node namespace of the directory (e.g. staging.sfdc)
+    :param selected: False if the directory was only scanned because it is
+        the parent of a selected directory, so its templates are not used
+    :param templates: Template (.sql) files in the directory
+    :param variable_files: Variable files (e.g. models.yml) in the directory,
+        by file name
+    :param fragments: Fragments of the variable files (e.g. the files in 
+        models.d/), by variable file name
+    """
+
+    path: str
+    rel_path: str
+    namespace: str
+    selected: bool
+    templates: list = field(default_factory=list)
+    variable_files: dict = field(default_factory=dict)
+    fragments: dict = field(default_factory=dict)
+
+
+def is_selected(namespace: str, select: str = None) -> bool:
+    """
+    Whether a directory namespace is a node namespace or beneath it
+
+    :param namespace: Node namespace of the directory
+    :param select: Node namespace (e.g. staging)
+    """
+
+    return not select \
+        or namespace == select \
+        or namespace.startswith(select + '.')
+
+
+def may_contain_selected(namespace: str, select: str = None) -> bool:
+    """
+    Whether a directory is a node namespace, beneath it, or a parent of it.
+    Any other directory (and everything beneath it) can be skipped.
+
+    :param namespace: Node namespace of the directory
+    :param select: Node namespace (e.g. staging)
+    """
+
+    return not namespace \
+        or is_selected(namespace, select) \
+        or select.startswith(namespace + '.')
+
+
+def _scan_fragments(dir_path: str) -> list:
+
+    with os.scandir(dir_path) as entries:
+        return sorted(
+            (
+                entry for entry in entries
+                if entry.name.endswith(FRAGMENT_EXTENSIONS)
+                and not entry.name.startswith('.')
+                and entry.is_file()
+            ),
+            key=lambda e: e.name
+        )
+
+
+def scan(
+        root_dir: str,
+        selector: Selector = None,
+        within: str = None,
+        variable_files: tuple = VARIABLE_FILES
+) -> Iterator[ScannedDir]:
+    """
+    Scans the .dbtgen tree in a single pass using os.scandir, yielding every
+    directory that may contain selected models or is a parent of one 
+    (parents before children, in name order). Branches which cannot contain
+    a selected model, and hidden directories, are not descended into.
+
+    :param root_dir: Top level directory of the tree (e.g. .dbtgen/)
+    :param selector: Compiled --select value
+    :param within: Node namespace (e.g. staging) the scan is limited to, 
+        e.g. the directory of a changed file
+    :param variable_files: Names of the variable files to collect, along 
+        with their fragments directories (e.g. models.d/)
+    """
+
+    root_dir = os.path.abspath(root_dir)
+    selector = selector or Selector()
+    fragment_dirs = {
+        fragment_dir_name(file_name): file_name for file_name in variable_files
+    }
+    pending = [(root_dir, '')]
+
+    while pending:
+        dir_path, rel_path = pending.pop()
+        namespace = rel_path.replace(os.sep, '.')
+
+        scanned = ScannedDir(
+            path=dir_path,
+            rel_path=rel_path,
+            namespace=namespace,
+            selected=bool(namespace)
+            and is_selected(namespace, within)
+            and selector.selects_children(namespace)
+        )
+        sub_dirs = []
+
+        try:
+            with tracer.span('scan', 'walk', directory=rel_path or '.'), \
+                    os.scandir(dir_path) as entries:
+                for entry in sorted(entries, key=lambda e: e.name):
+
+                    if entry.is_dir():
+                        if entry.name.startswith('.'):
+                            continue
+                        if entry.name in fragment_dirs:
+                            scanned.fragments[fragment_dirs[entry.name]] = \
+                                _scan_fragments(entry.path)
+                            continue
+                        sub_rel_path = os.path.join(rel_path, entry.name)
+                        sub_namespace = sub_rel_path.replace(os.sep, '.')
+                        if may_contain_selected(sub_namespace, within) \
+                                and selector.may_contain(sub_namespace):
+                            sub_dirs.append((entry.path, sub_rel_path))
+
+                    elif entry.name.endswith('.sql'):
+                        scanned.templates.append(entry)
+
+                    elif entry.name in variable_files:
+                        scanned.variable_files[entry.name] = entry
+
+        except FileNotFoundError:
+            continue
+
+        yield scanned
+
+        pending.extend(reversed(sub_dirs))
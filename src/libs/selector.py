@@ -0,0 +1,196 @@
+import re
+
+NODE_SEPARATOR = '.'
+
+
+def _translate(part: str) -> str:
+    """
+    Translates one glob part of a node selector (e.g. stg_*) into a regular
+    expression. Wildcards do not match across the '.' between nodes.
+    """
+
+    regex = []
+    i = 0
+
+    while i < len(part):
+        char = part[i]
+
+        if char == '*':
+            regex.append(r'[^.]*')
+        elif char == '?':
+            regex.append(r'[^.]')
+        elif char == '[' and ']' in part[i + 1:]:
+            end = part.index(']', i + 1)
+            chars = part[i + 1:end]
+            if chars.startswith('!'):
+                chars = '^' + chars[1:]
+            regex.append(f'[{chars}]')
+            i = end
+        else:
+            regex.append(re.escape(char))
+
+        i += 1
+
+    return ''.join(regex)
+
+
+def _compile(patterns: list):
+    """
+    Compiles patterns into one regular expression, so that matching a name
+    against any number of patterns is a single match
+    """
+
+    if not patterns:
+        return None
+
+    return re.compile('|'.join(f'(?:{pattern})' for pattern in patterns))
+
+
+class Selector:
+    """
+    A compiled --select value. Selectors are comma separated node paths (e.g.
+    staging, staging.sfdc or staging.stg_account), which may contain glob
+    wildcards within a node (e.g. staging.stg_*, *.sfdc). A selector matches
+    a node and everything beneath it. Selectors prefixed with '!' (or given
+    with --exclude) are excluded.
+
+    All selectors are compiled into a regular expression per kind of match,
+    so the cost of matching a directory or model does not depend on the
+    number of selectors.
+
+    :param select: Comma separated selectors (e.g. staging,!staging.stg_lead)
+    :param exclude: Comma separated selectors to exclude
+    """
+
+    def __init__(self, select: str = None, exclude: str = None):
+        includes = []
+        excludes = []
+
+        for selector in (select or '').split(','):
+            selector = selector.strip()
+            if selector.startswith('!'):
+                excludes.append(selector[1:])
+            elif selector:
+                includes.append(selector)
+
+        for selector in (exclude or '').split(','):
+            if selector.strip():
+                excludes.append(selector.strip().lstrip('!'))
+
+        self.includes = includes
+        self.excludes = excludes
+
+        include_parts = [self._parts(s) for s in includes]
+        exclude_parts = [self._parts(s) for s in excludes]
+
+        # A node matching a selector, or beneath it
+        self._include = _compile(
+            [self._node(parts) + r'(?:\..*)?\Z' for parts in include_parts]
+        )
+        self._exclude = _compile(
+            [self._node(parts) + r'(?:\..*)?\Z' for parts in exclude_parts]
+        )
+        # A directory above a node matching a selector
+        self._ancestor = _compile(
+            [self._ancestor_of(parts) + r'\Z'
+             for parts in include_parts if len(parts) > 1]
+        )
+        # A directory directly containing a node matching a selector
+        self._parent = _compile(
+            [self._node(parts[:-1]) + r'\Z'
+             for parts in include_parts if len(parts) > 1]
+        )
+
+    def __str__(self) -> str:
+        return ','.join(
+            self.includes + [f'!{selector}' for selector in self.excludes]
+        )
+
+    @staticmethod
+    def _parts(selector: str) -> list:
+        return [_translate(part) for part in selector.split(NODE_SEPARATOR)]
+
+    @staticmethod
+    def _node(parts: list) -> str:
+        return r'\.'.join(parts)
+
+    @staticmethod
+    def _ancestor_of(parts: list) -> str:
+        # e.g. a.b.c -> a(?:\.b)?, matching a and a.b
+        regex = ''
+        for part in reversed(parts[1:-1]):
+            regex = rf'(?:\.{part}{regex})?'
+        return parts[0] + regex
+
+    def _excluded(self, namespace: str) -> bool:
+        return bool(self._exclude and self._exclude.match(namespace))
+
+    def matches(self, name: str) -> bool:
+        """
+        Whether a node (e.g. the model staging.stg_account) is selected
+
+        :param name: Full name of the node
+        """
+
+        return (not self._include or bool(self._include.match(name))) \
+            and not self._excluded(name)
+
+    def may_contain(self, namespace: str) -> bool:
+        """
+        Whether a directory may contain a selected node, so must be scanned.
+        Any other directory (and everything beneath it) can be skipped.
+
+        :param namespace: Node namespace of the directory (e.g. staging.sfdc)
+        """
+
+        if not namespace:
+            return True
+
+        return (
+            not self._include
+            or bool(self._include.match(namespace))
+            or bool(self._ancestor and self._ancestor.match(namespace))
+        ) and not self._excluded(namespace)
+
+    def selects_children(self, namespace: str) -> bool:
+        """
+        Whether the models of a directory (e.g. staging.stg_account in
+        staging) may be selected, so its templates must be processed
+
+        :param namespace: Node namespace of the directory
+        """
+
+        return (
+            not self._include
+            or bool(self._include.match(namespace))
+            or bool(self._parent and self._parent.match(namespace))
+        ) and not self._excluded(namespace)
+
+
+class NameSet:
+    """
+    A set of names (e.g. the models in ignore.yml), which may include glob
+    patterns (e.g. stg_*_old). Plain names are held in a set and patterns
+    compiled into one regular expression, so membership is a hash lookup
+    and at most one match.
+
+    :param names: Names and glob patterns
+    """
+
+    def __init__(self, names=None):
+        names = [str(name) for name in names or ()]
+
+        self.names = {
+            name for name in names if not any(c in name for c in '*?[')
+        }
+        self._patterns = _compile(
+            [_translate(name) + r'\Z' for name in names
+             if name not in self.names]
+        )
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.names \
+            or bool(self._patterns and self._patterns.match(name))
+
+    def __bool__(self) -> bool:
+        return bool(self.names or self._patterns)
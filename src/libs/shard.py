@@ -0,0 +1,172 @@
+import argparse
+import hashlib
+import json
+import os
+
+MANIFEST_VERSION = 1
+
+
+def parse_shard(value: str) -> tuple:
+    """
+    Parses a --shard value (e.g. 2/4), used as an argparse type
+
+    :param value: Shard index and number of shards, separated by '/'
+    :returns: Shard index (from 1) and number of shards
+    """
+
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"Shard must be of the format i/n (e.g. 2/4), got '{value}'"
+        )
+
+    if count < 1 or not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(
+            f"Shard index must be between 1 and {count}, got '{value}'"
+        )
+
+    return index, count
+
+
+def shard_of(key: str, count: int) -> int:
+    """
+    Returns the shard a unit of work belongs to. Uses a content hash rather
+    than hash(), so every process (and CI runner) assigns the same shard.
+
+    :param key: Stable identifier of the unit of work (e.g. an output path)
+    :param count: Number of shards
+    :returns: Shard index (from 1)
+    """
+
+    digest = hashlib.sha256(key.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % count + 1
+
+
+def in_shard(key: str, shard: tuple = None) -> bool:
+    """
+    Whether a unit of work belongs to a shard
+
+    :param key: Stable identifier of the unit of work (e.g. an output path)
+    :param shard: Shard index and number of shards, or None for all work
+    """
+
+    return shard is None or shard_of(key, shard[1]) == shard[0]
+
+
+def manifest_path(manifest_dir: str, command: str, shard: tuple) -> str:
+    """
+    Returns the default path of a shard manifest (e.g.
+    .dbtgen/.shards/model-2-of-4.json)
+    """
+
+    return os.path.join(manifest_dir, f'{command}-{shard[0]}-of-{shard[1]}.json')
+
+
+def write_manifest(
+        file_path: str,
+        command: str,
+        shard: tuple,
+        counts: dict,
+        outputs: dict,
+        state: dict = None,
+        owners: dict = None,
+        pruned: list = None
+) -> None:
+    """
+    Writes the run summary and outputs of a shard
+
+    :param file_path: Path to the manifest file
+    :param command: Sub-command the shard ran (e.g. model)
+    :param shard: Shard index and number of shards
+    :param counts: Summary counts by status
+    :param outputs: Status of each output file, by path relative to the
+        project root
+    :param state: State file entries of the outputs, by path
+    :param owners: Ownership index entries of the outputs, by path
+    :param pruned: Paths of the files pruned by the shard
+    """
+
+    os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+
+    with open(file_path, 'w') as f:
+        json.dump(
+            {
+                'version': MANIFEST_VERSION,
+                'command': command,
+                'shard': list(shard),
+                'counts': counts,
+                'outputs': outputs,
+                'state': state or {},
+                'owners': owners or {},
+                'pruned': pruned or []
+            },
+            f,
+            indent=2,
+            sort_keys=True
+        )
+
+
+def merge_manifests(manifests: list) -> dict:
+    """
+    Combines the manifests of every shard of a run into a single manifest,
+    equivalent to that of an unsharded run
+
+    :param manifests: Manifests of each shard
+    :raises RuntimeError: If the manifests are from different commands or
+        numbers of shards, a shard is missing or duplicated, or an output was
+        generated by more than one shard
+    """
+
+    if not manifests:
+        raise RuntimeError('No shard manifests found')
+
+    command = manifests[0]['command']
+    count = manifests[0]['shard'][1]
+    merged = {
+        'version': MANIFEST_VERSION,
+        'command': command,
+        'shard': [1, 1],
+        'counts': {},
+        'outputs': {},
+        'state': {},
+        'owners': {},
+        'pruned': []
+    }
+    seen = set()
+
+    for manifest in manifests:
+        index, manifest_count = manifest['shard']
+
+        if manifest['command'] != command or manifest_count != count:
+            raise RuntimeError(
+                f"Cannot merge shard {index}/{manifest_count} of "
+                f"{manifest['command']} with shards of {command} (n={count})"
+            )
+        if index in seen:
+            raise RuntimeError(f'Shard {index}/{count} found more than once')
+        seen.add(index)
+
+        for status, value in manifest['counts'].items():
+            merged['counts'][status] = merged['counts'].get(status, 0) + value
+
+        for path, status in manifest['outputs'].items():
+            if path in merged['outputs']:
+                raise RuntimeError(f'{path} was generated by more than one shard')
+            merged['outputs'][path] = status
+
+        merged['state'].update(manifest.get('state', {}))
+        merged['owners'].update(manifest.get('owners', {}))
+        merged['pruned'].extend(manifest.get('pruned', []))
+
+    missing = sorted(set(range(1, count + 1)) - seen)
+    if missing:
+        raise RuntimeError(
+            f"Missing manifests for shards {', '.join(map(str, missing))} "
+            f"of {count}"
+        )
+
+    merged['outputs'] = dict(sorted(merged['outputs'].items()))
+    merged['pruned'].sort()
+
+    return merged
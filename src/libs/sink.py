@@ -0,0 +1,211 @@
+import io
+import json
+import os
+import sys
+import tarfile
+import threading
+import time
+import zipfile
+from abc import ABC, abstractmethod
+from typing import TextIO
+
+from .file_handler import WritePlanner, write_file
+
+
+class FileSystemSink:
+    """
+    Writes generated files into the working tree (the default). Each target
+    directory is created or listed once, and files whose contents are
+    unchanged are not rewritten. Safe to use from worker threads.
+    """
+
+    # Files written to this sink can be checked on the next run (e.g. by the
+    # state of incremental runs)
+    persistent = True
+
+    def __init__(self):
+        self.planner = WritePlanner()
+
+    def exists(self, file_path: str) -> bool:
+        """
+        Whether a file already exists in the sink
+
+        :param file_path: Path to the target file
+        """
+
+        return self.planner.exists(file_path)
+
+    def write(
+            self,
+            file_path: str,
+            contents: str,
+            exists: bool = True
+    ) -> bool:
+        """
+        Writes a generated file
+
+        :param file_path: Path to the target file
+        :param contents: Contents to write
+        :param exists: False if the file is already known not to exist
+        :returns: True if the file was written, False if it was unchanged
+        """
+
+        self.planner.prepare(os.path.dirname(file_path))
+        written = write_file(file_path, contents, exists)
+        self.planner.add(file_path)
+
+        return written
+
+    def close(self) -> None:
+        pass
+
+
+class Sink(ABC):
+    """
+    Base class of the sinks which collect generated files outside of the
+    working tree. Files are recorded by their path relative to the project
+    root, and only exist in the sink once written during this run. Sub-classes
+    implement _write, and close if they hold a resource.
+
+    :param root_dir: Directory that paths are recorded relative to
+    """
+
+    persistent = False
+
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+        self._names = set()
+        self._lock = threading.Lock()
+
+    def _key(self, file_path: str) -> str:
+        return os.path.relpath(file_path, self.root_dir)
+
+    def exists(self, file_path: str) -> bool:
+        return self._key(file_path) in self._names
+
+    def write(
+            self,
+            file_path: str,
+            contents: str,
+            exists: bool = True
+    ) -> bool:
+        key = self._key(file_path)
+
+        with self._lock:
+            self._write(key, contents)
+            self._names.add(key)
+
+        return True
+
+    @abstractmethod
+    def _write(self, key: str, contents: str) -> None:
+        """
+        Writes a file to the sink. Called with the sink's lock held.
+
+        :param key: Path to the file, relative to the root directory
+        :param contents: Contents of the file
+        """
+
+    def close(self) -> None:
+        pass
+
+
+class MemorySink(Sink):
+    """
+    Collects generated files in a dictionary of contents by relative path,
+    e.g. for tests or when dbtgen is embedded in another tool
+    """
+
+    def __init__(self, root_dir: str):
+        super().__init__(root_dir)
+        self.files = {}
+
+    def _write(self, key: str, contents: str) -> None:
+        self.files[key] = contents
+
+
+class ArchiveSink(Sink):
+    """
+    Writes generated files into a single tar (.tar, .tar.gz, .tgz) or zip
+    (.zip) archive, as one sequential write rather than a file per output
+
+    :param file_path: Path to the archive
+    :param root_dir: Directory that paths are recorded relative to
+    """
+
+    def __init__(self, file_path: str, root_dir: str):
+        super().__init__(root_dir)
+        self.file_path = file_path
+        self._zip = file_path.endswith('.zip')
+
+        if self._zip:
+            self._archive = zipfile.ZipFile(
+                file_path, 'w', compression=zipfile.ZIP_DEFLATED
+            )
+        else:
+            self._archive = tarfile.open(
+                file_path,
+                'w:gz' if file_path.endswith(('.tar.gz', '.tgz')) else 'w'
+            )
+
+    def _write(self, key: str, contents: str) -> None:
+        data = contents.encode('utf-8')
+
+        if self._zip:
+            self._archive.writestr(key, data)
+        else:
+            info = tarfile.TarInfo(key)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            info.mode = 0o644
+            self._archive.addfile(info, io.BytesIO(data))
+
+    def close(self) -> None:
+        self._archive.close()
+
+
+class JsonlSink(Sink):
+    """
+    Streams generated files as JSON lines of {"path": ..., "contents": ...}
+    records, to standard output by default
+
+    :param root_dir: Directory that paths are recorded relative to
+    :param stream: Stream to write the records to
+    """
+
+    def __init__(self, root_dir: str, stream: TextIO = None):
+        super().__init__(root_dir)
+        self.stream = stream or sys.stdout
+
+    def _write(self, key: str, contents: str) -> None:
+        self.stream.write(json.dumps({'path': key, 'contents': contents}))
+        self.stream.write('\n')
+
+    def close(self) -> None:
+        self.stream.flush()
+
+
+def create_sink(output: str, root_dir: str):
+    """
+    Returns the sink for a --sink value
+
+    :param output: files (the working tree), jsonl (JSON lines on standard
+        output), or the path of a .tar, .tar.gz, .tgz or .zip archive. A
+        MemorySink is only created directly (e.g. from the Python API), as
+        its contents would otherwise be discarded
+    :param root_dir: Directory that paths are recorded relative to (the
+        project root)
+    :raises ValueError: If the value is not a sink or archive path
+    """
+
+    if not output or output == 'files':
+        return FileSystemSink()
+    if output == 'jsonl':
+        return JsonlSink(root_dir)
+    if output.endswith(('.tar', '.tar.gz', '.tgz', '.zip')):
+        return ArchiveSink(output, root_dir)
+
+    raise ValueError(
+        f"Unknown sink '{output}'. Use files, jsonl, or the path of a .tar, "
+        ".tar.gz, .tgz or .zip archive"
+    )
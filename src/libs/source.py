@@ -1,8 +1,9 @@
-from os import makedirs, path
+from os import path
 from typing import Tuple
 import yaml
 
 from .logger import CustomLogger
+from .sink import FileSystemSink
 from .yaml_handler import read_yaml_file, BaseDumper, QuotedString
 
 logger = CustomLogger()
@@ -37,28 +38,39 @@ class Source:
             ]
         }
 
-    def write(self, target_dir: str, overwrite: bool = False):
+    def write(
+        self,
+        target_dir: str,
+        overwrite: bool = False,
+        sink: FileSystemSink = None
+    ):
         """
-        Writes the source object contents to a yaml file
+        Writes the source object contents to a yaml file, if they differ from
+        the existing file
 
         :param target_dir: Local path to folder to write the file        
+        :param sink: Where the file is written (by default, the working tree)
+        :returns: Path to the file and its status (CREATED or UNCHANGED)
         """
 
         file_name = f'.dbtgen__{self.name}' if not overwrite else self.name
         file_path = path.join(target_dir, f'{file_name}.yml')
 
-        if not path.exists(target_dir):
-            makedirs(target_dir)
+        sink = sink or FileSystemSink()
 
-        with open(file_path, 'w') as outfile:
+        written = sink.write(
+            file_path,
             yaml.dump(
                 self.contents, 
-                outfile, 
                 Dumper=BaseDumper,
                 default_flow_style=False, 
                 sort_keys=False
             )
-        logger.status(file_name, 'CREATED')
+        )
+        status = 'CREATED' if written else 'UNCHANGED'
+        logger.status(file_name, status)
+
+        return file_path, status
 
 
 class SourceFactory:
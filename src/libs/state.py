@@ -0,0 +1,180 @@
+import hashlib
+import json
+import os
+import threading
+
+STATE_VERSION = 1
+
+
+def hash_contents(contents: str) -> str:
+    """
+    Returns a content hash for a string (e.g. a template or rendered model)
+
+    :param contents: The string to be hashed
+    """
+
+    return hashlib.sha256(contents.encode('utf-8')).hexdigest()
+
+
+def hash_variables(variables: dict) -> str:
+    """
+    Returns a content hash for a dictionary of model variables. Keys are
+    sorted so that the hash does not depend on the order in the YAML file.
+
+    :param variables: Dictionary with model variables
+    """
+
+    return hash_contents(json.dumps(variables, sort_keys=True, default=str))
+
+
+class State:
+    """
+    Persisted record of the inputs and outputs of the last run, used to skip
+    models whose template and variables have not changed since they were
+    last generated.
+
+    The state file has the following structure:
+
+        {
+            "version": 1,
+            "models": {
+                "<output path, relative to the project root>": {
+                    "template": "<hash>",
+                    "variables": "<hash>",
+                    "output": "<hash>",
+                    "size": <bytes>,
+                    "mtime_ns": <int>
+                }
+            }
+        }
+
+    :param file_path: Path to the state file (e.g. .dbtgen/.state.json)
+    :param root_dir: Directory that output paths are recorded relative to
+    """
+
+    def __init__(self, file_path: str, root_dir: str):
+        self.file_path = file_path
+        self.root_dir = root_dir
+        self.models = {}
+        self._lock = threading.Lock()
+        # Whether any entry changed since the state was loaded
+        self._dirty = False
+
+        try:
+            with open(file_path, 'r') as f:
+                contents = json.load(f)
+            if contents.get('version') == STATE_VERSION:
+                self.models = contents.get('models', {})
+
+        except (FileNotFoundError, ValueError):
+            pass
+
+    def _key(self, output_path: str) -> str:
+        return os.path.relpath(output_path, self.root_dir)
+
+    def is_unchanged(
+            self,
+            output_path: str,
+            template_hash: str,
+            variables_hash: str
+    ) -> bool:
+        """
+        Checks whether a model was generated from the same template and
+        variables, and that the output file has not been modified since.
+
+        :param output_path: Path to the generated model file
+        :param template_hash: Content hash of the template
+        :param variables_hash: Content hash of the model variables
+        """
+
+        entry = self.models.get(self._key(output_path))
+
+        if not entry \
+                or entry['template'] != template_hash \
+                or entry['variables'] != variables_hash:
+            return False
+
+        try:
+            stat = os.stat(output_path)
+        except FileNotFoundError:
+            return False
+
+        return stat.st_size == entry['size'] \
+            and stat.st_mtime_ns == entry['mtime_ns']
+
+    def record(
+            self,
+            output_path: str,
+            template_hash: str,
+            variables_hash: str,
+            output_hash: str
+    ) -> None:
+        """
+        Records the inputs and output of a generated model. Safe to call from
+        worker threads.
+
+        :param output_path: Path to the generated model file
+        :param template_hash: Content hash of the template
+        :param variables_hash: Content hash of the model variables
+        :param output_hash: Content hash of the rendered model
+        """
+
+        stat = os.stat(output_path)
+
+        entry = {
+            'template': template_hash,
+            'variables': variables_hash,
+            'output': output_hash,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns
+        }
+
+        with self._lock:
+            key = self._key(output_path)
+            if self.models.get(key) != entry:
+                self.models[key] = entry
+                self._dirty = True
+
+    def update(self, entries: dict) -> None:
+        """
+        Records the entries of another state (e.g. of a shard)
+
+        :param entries: Entries by output path, relative to the root directory
+        """
+
+        with self._lock:
+            for key, entry in entries.items():
+                if self.models.get(key) != entry:
+                    self.models[key] = entry
+                    self._dirty = True
+
+    def remove(self, output_path: str) -> None:
+        """
+        Forgets a model file, e.g. once it has been deleted
+
+        :param output_path: Path to the model file
+        """
+
+        with self._lock:
+            if self.models.pop(self._key(output_path), None) is not None:
+                self._dirty = True
+
+    def save(self) -> None:
+        """
+        Writes the state to disk, if any entry changed. Written without
+        indentation, so that the C encoder of the json module is used.
+        """
+
+        if not self._dirty:
+            return
+
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+
+        with open(self.file_path, 'w') as f:
+            f.write(json.dumps(
+                {'version': STATE_VERSION, 'models': self.models},
+                separators=(',', ':'),
+                sort_keys=True
+            ))
+
+        self._dirty = False
@@ -0,0 +1,147 @@
+import string
+import threading
+from collections import OrderedDict
+
+from .state import hash_contents
+
+# Compiled templates and file name patterns are shared by every project in
+# the process, so only the most recently used are kept
+MAX_CACHED_TEMPLATES = 1024
+
+_formatter = string.Formatter()
+_templates = OrderedDict()
+_file_name_patterns = OrderedDict()
+_lock = threading.Lock()
+
+
+class CompiledTemplate:
+    """
+    A template SQL file parsed once into literal text and placeholders, so
+    that rendering a model is a single join rather than a regular expression
+    substitution over the whole template.
+
+    Supports the same placeholders as string.Template (e.g. ${my_variable},
+    $my_variable and $$ as an escaped '$').
+
+    :param source: Contents of the template file
+    :param source_hash: Content hash of the template, if already known
+    """
+
+    def __init__(self, source: str, source_hash: str = None):
+        self.source = source
+        self.hash = source_hash or hash_contents(source)
+        self.parts = []
+        self.variables = set()
+
+        literal_start = 0
+
+        for match in string.Template.pattern.finditer(source):
+            self.parts.append(source[literal_start:match.start()])
+            literal_start = match.end()
+
+            if match.group('escaped') is not None:
+                self.parts.append('$')
+                continue
+
+            name = match.group('named') or match.group('braced')
+            if name is None:
+                lines = source[:match.start('invalid')].splitlines(keepends=True)
+                raise ValueError(
+                    f'Invalid placeholder in template: line {len(lines) or 1}, '
+                    f'col {len(lines[-1]) if lines else 1}'
+                )
+
+            self.parts.append((name,))
+            self.variables.add(name)
+
+        self.parts.append(source[literal_start:])
+        self.parts = [part for part in self.parts if part != '']
+
+    def render(self, **variables) -> str:
+        """
+        Substitutes the model variables into the template
+
+        :raises KeyError: If a placeholder has no matching variable
+        """
+
+        return ''.join(
+            part if isinstance(part, str) else str(variables[part[0]])
+            for part in self.parts
+        )
+
+
+class CompiledFileNamePattern:
+    """
+    A parameterised template file name (e.g. stg_{name}.sql) parsed once into
+    literal text and replacement fields.
+
+    :param pattern: The template file name
+    """
+
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+        self.parts = list(_formatter.parse(pattern))
+
+    def render(self, **variables) -> str:
+        """
+        Formats the file name using the model variables, equivalent to
+        str.format(**variables)
+        """
+
+        file_name = []
+
+        for literal, field_name, format_spec, conversion in self.parts:
+            file_name.append(literal)
+
+            if field_name is not None:
+                value, _ = _formatter.get_field(field_name, (), variables)
+                value = _formatter.convert_field(value, conversion)
+                file_name.append(_formatter.format_field(value, format_spec))
+
+        return ''.join(file_name)
+
+
+def _cached(cache: OrderedDict, key: str, compile_source):
+    """
+    Returns the cached value of a key, compiling and caching it (and evicting
+    the least recently used value once the cache is full) if missing
+    """
+
+    with _lock:
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+
+        value = cache[key] = compile_source()
+        if len(cache) > MAX_CACHED_TEMPLATES:
+            cache.popitem(last=False)
+
+        return value
+
+
+def compile_template(source: str) -> CompiledTemplate:
+    """
+    Returns the compiled form of a template. Templates are keyed by content
+    hash, so identical templates in different directories (or projects) are
+    only parsed once.
+
+    :param source: Contents of the template file
+    """
+
+    key = hash_contents(source)
+
+    return _cached(_templates, key, lambda: CompiledTemplate(source, key))
+
+
+def compile_file_name_pattern(pattern: str) -> CompiledFileNamePattern:
+    """
+    Returns the compiled form of a template file name
+
+    :param pattern: The template file name (e.g. stg_{name}.sql)
+    """
+
+    return _cached(
+        _file_name_patterns,
+        pattern,
+        lambda: CompiledFileNamePattern(pattern)
+    )
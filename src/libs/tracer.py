@@ -0,0 +1,108 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Tracer:
+    """
+    Records timed spans (e.g. directory walk, YAML loading, rendering, file
+    writes, warehouse queries) as Chrome trace events, which can be opened in
+    chrome://tracing or https://ui.perfetto.dev.
+
+    Tracing is disabled by default, in which case spans cost a single
+    attribute check.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self._lock = threading.Lock()
+        self._start = time.perf_counter_ns()
+
+    def enable(self) -> None:
+        self.enabled = True
+        self.events = []
+        self._start = time.perf_counter_ns()
+
+    @contextmanager
+    def span(self, name: str, category: str, **attributes):
+        """
+        Context manager recording the duration of the enclosed block
+
+        :param name: Name of the span (e.g. render)
+        :param category: Category of the span (e.g. yaml, io, query)
+        :param attributes: Attributes shown with the span (e.g. model name)
+        """
+
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            end = time.perf_counter_ns()
+            event = {
+                'name': name,
+                'cat': category,
+                'ph': 'X',
+                'ts': (start - self._start) / 1000,
+                'dur': (end - start) / 1000,
+                'pid': os.getpid(),
+                'tid': threading.get_ident(),
+                'args': attributes
+            }
+            with self._lock:
+                self.events.append(event)
+
+    def traced(self, category: str, **attributes):
+        """
+        Decorator recording a span for each call of a function, named after
+        the function. The first positional argument is recorded as 'target'.
+
+        :param category: Category of the span
+        """
+
+        def decorator(func):
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+
+                target = {'target': str(args[0])} if args else {}
+                with self.span(func.__name__, category, **target, **attributes):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def slowest(self, n: int = 10) -> list:
+        """
+        Returns the n slowest spans
+
+        :param n: Number of spans to return
+        """
+
+        return sorted(self.events, key=lambda e: e['dur'], reverse=True)[:n]
+
+    def save(self, file_path: str) -> None:
+        """
+        Writes the recorded spans to a Chrome trace event JSON file
+
+        :param file_path: Path to the trace file
+        """
+
+        with open(file_path, 'w') as f:
+            json.dump(
+                {'traceEvents': self.events, 'displayTimeUnit': 'ms'},
+                f
+            )
+
+
+tracer = Tracer()
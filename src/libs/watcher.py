@@ -0,0 +1,247 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE \
+    | IN_DELETE | IN_DELETE_SELF
+
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def _is_hidden(root_dir: str, path: str) -> bool:
+    """
+    Whether a path is a hidden file or directory (e.g. .dbtgen/.state.json or
+    an editor's temporary file), which changes are not reported for
+    """
+
+    rel_path = os.path.relpath(path, root_dir)
+    return any(part.startswith('.') for part in rel_path.split(os.sep))
+
+
+class PollingWatcher:
+    """
+    Watches a directory tree for changes by comparing the modification time
+    and size of every file at a fixed interval. Used where inotify is not
+    available.
+
+    :param root_dir: Top level directory to watch
+    :param interval: Seconds between each scan of the tree
+    """
+
+    def __init__(self, root_dir: str, interval: float = 1.0):
+        self.root_dir = os.path.abspath(root_dir)
+        self.interval = interval
+        self._snapshot = self._scan()
+
+    def _scan(self) -> dict:
+        snapshot = {}
+        pending = [self.root_dir]
+
+        while pending:
+            dir_path = pending.pop()
+            try:
+                with os.scandir(dir_path) as entries:
+                    for entry in entries:
+                        if entry.name.startswith('.'):
+                            continue
+                        if entry.is_dir():
+                            snapshot[entry.path] = None
+                            pending.append(entry.path)
+                        else:
+                            stat = entry.stat()
+                            snapshot[entry.path] = \
+                                (stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                pass
+
+        return snapshot
+
+    def changes(self, timeout: float = None) -> set:
+        """
+        Blocks until files in the tree change, or the timeout passes
+
+        :param timeout: Maximum number of seconds to wait
+        :returns: Paths of the created, modified or deleted files
+        """
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            snapshot = self._scan()
+            changed = {
+                path for path in snapshot.keys() | self._snapshot.keys()
+                if snapshot.get(path) != self._snapshot.get(path)
+                or (path in snapshot) != (path in self._snapshot)
+            }
+            self._snapshot = snapshot
+
+            if changed:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+
+            time.sleep(self.interval)
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyWatcher:
+    """
+    Watches a directory tree for changes using Linux inotify. Every
+    directory is watched, including directories created after the watcher
+    is started.
+
+    :param root_dir: Top level directory to watch
+    :param settle: Seconds to keep collecting events after the first one, so
+        that e.g. an editor saving several files produces one set of changes
+    """
+
+    def __init__(self, root_dir: str, settle: float = 0.2):
+        self.root_dir = os.path.abspath(root_dir)
+        self.settle = settle
+        self._libc = ctypes.CDLL(
+            ctypes.util.find_library('c') or 'libc.so.6',
+            use_errno=True
+        )
+        self._fd = self._libc.inotify_init1(os.O_CLOEXEC)
+
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        self._watches = {}
+        self._add_tree(self.root_dir)
+
+    def _add_watch(self, dir_path: str) -> None:
+        wd = self._libc.inotify_add_watch(
+            self._fd, os.fsencode(dir_path), WATCH_MASK
+        )
+        if wd >= 0:
+            self._watches[wd] = dir_path
+
+    def _add_tree(self, dir_path: str) -> set:
+        """
+        Watches a directory and all of its sub-directories
+
+        :returns: Paths of the files found, which may have been created
+            before the watch was added
+        """
+
+        found = set()
+        pending = [dir_path]
+
+        while pending:
+            path = pending.pop()
+            self._add_watch(path)
+            try:
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        if entry.is_dir():
+                            if not entry.name.startswith('.'):
+                                pending.append(entry.path)
+                        else:
+                            found.add(entry.path)
+            except FileNotFoundError:
+                pass
+
+        return found
+
+    def _read_events(self, timeout: float = None) -> set:
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return set()
+
+        buffer = os.read(self._fd, 64 * 1024)
+        changed = set()
+        offset = 0
+
+        while offset < len(buffer):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(buffer, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(buffer[offset:offset + length].rstrip(b'\0'))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped, so report the whole tree as changed
+                changed.add(self.root_dir)
+                continue
+
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+
+            dir_path = self._watches.get(wd)
+            if dir_path is None:
+                continue
+
+            path = os.path.join(dir_path, name) if name else dir_path
+            if _is_hidden(self.root_dir, path):
+                continue
+
+            if mask & IN_ISDIR and mask & IN_MOVED_FROM:
+                # The directory no longer exists under this path, so its
+                # namespace cannot be mapped back. Report the whole tree.
+                changed.add(self.root_dir)
+                continue
+
+            changed.add(path)
+
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                changed.update(self._add_tree(path))
+
+        return changed
+
+    def changes(self, timeout: float = None) -> set:
+        """
+        Blocks until files in the tree change, or the timeout passes
+
+        :param timeout: Maximum number of seconds to wait
+        :returns: Paths of the created, modified or deleted files and
+            directories
+        """
+
+        changed = self._read_events(timeout)
+
+        if changed:
+            while True:
+                more = self._read_events(self.settle)
+                if not more:
+                    break
+                changed.update(more)
+
+        return changed
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+def create_watcher(root_dir: str, polling: bool = False):
+    """
+    Returns an inotify watcher on Linux, falling back to polling where
+    inotify is not available
+
+    :param root_dir: Top level directory to watch
+    :param polling: If True, always use polling
+    """
+
+    if not polling and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(root_dir)
+        except (OSError, AttributeError):
+            pass
+
+    return PollingWatcher(root_dir)
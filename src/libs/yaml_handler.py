@@ -1,5 +1,20 @@
+import hashlib
+import os
+import pickle
+import tempfile
+from typing import Iterator
+
 import yaml
 
+from .tracer import tracer
+
+# Use the LibYAML parser when PyYAML was built with it. BaseDumper keeps the
+# pure Python emitter, as the LibYAML emitter ignores increase_indent and
+# would not produce identical output.
+SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+_cache_dir = None
+
 
 class QuotedString(str):
     """Sub-class str used for quoting YAML contents"""
@@ -25,6 +40,62 @@ class BaseDumper(yaml.Dumper):
         ).represent_scalar('tag:yaml.org,2002:str', data, style='"')
 
 
+def enable_cache(cache_dir: str) -> None:
+    """
+    Enables the persistent cache of parsed YAML files. Parsed contents are
+    stored (pickled) in the cache directory, keyed by the path, size and 
+    modification time of the YAML file, so unchanged files are not parsed 
+    again in later runs.
+
+    :param cache_dir: Directory to store the parsed files in
+    """
+
+    global _cache_dir
+
+    os.makedirs(cache_dir, exist_ok=True)
+    _cache_dir = cache_dir
+
+
+def _parse_yaml_file(file_path: str) -> dict:
+
+    with open(file_path, 'rb') as f:
+        return yaml.load(f, Loader=SafeLoader)
+
+
+def _read_cached_yaml_file(file_path: str) -> dict:
+
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    cache_path = os.path.join(
+        _cache_dir,
+        f"{hashlib.sha256(key[0].encode('utf-8')).hexdigest()}.pickle"
+    )
+
+    try:
+        with open(cache_path, 'rb') as f:
+            cached_key, contents = pickle.load(f)
+        if cached_key == key:
+            return contents
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        pass
+
+    contents = _parse_yaml_file(file_path)
+
+    fd, tmp_path = tempfile.mkstemp(dir=_cache_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((key, contents), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+    return contents
+
+
+@tracer.traced('yaml')
 def read_yaml_file(file_path: str) -> dict:
     """
     Reads the contents of a yaml file and returns as a dictionary
@@ -34,7 +105,104 @@ def read_yaml_file(file_path: str) -> dict:
     :returns: Dictionary object with the YAML contents
     """
 
-    with open(file_path, 'r') as f:
-        file = f.read()
+    if _cache_dir:
+        return _read_cached_yaml_file(file_path)
+
+    return _parse_yaml_file(file_path)
+
+
+def _construct(loader: yaml.SafeLoader, node: yaml.Node):
+    """
+    Constructs the Python object of a node, then forgets the constructed
+    objects so they are not kept for the rest of the document
+    """
+
+    value = loader.construct_object(node, deep=True)
+    loader.constructed_objects = {}
+    loader.recursive_objects = {}
+
+    return value
+
+
+def stream_yaml_mapping(file_path: str, key: str) -> Iterator[tuple]:
+    """
+    Parses the mapping under a top level key of a YAML file (e.g. models in
+    models.yml) one entry at a time, using the event and compose API, and 
+    yields (name, value) pairs as they are parsed. Only one entry is held in
+    memory at a time (plus any anchored nodes, so aliases can be resolved), 
+    and the first entry is yielded before the rest of the file is read.
+
+    The pure Python parser is used, as the LibYAML parser does not expose 
+    the compose API.
+
+    :param file_path: Path to the .yml file
+    :param key: Top level key of the mapping (e.g. models)
+    :raises ValueError: If the mapping contains the same name more than once
+    """
+
+    with open(file_path, 'rb') as f:
+        loader = yaml.SafeLoader(f)
+
+        try:
+            loader.get_event()
+
+            if loader.check_event(yaml.StreamEndEvent):
+                return
+
+            loader.get_event()
+
+            if not loader.check_event(yaml.MappingStartEvent):
+                return
+
+            loader.get_event()
+
+            while not loader.check_event(yaml.MappingEndEvent):
+                top_level_key = _construct(loader, loader.compose_node(None, None))
+
+                if top_level_key != key \
+                        or not loader.check_event(yaml.MappingStartEvent):
+                    loader.compose_node(None, None)
+                    continue
+
+                loader.get_event()
+                names = set()
+
+                while not loader.check_event(yaml.MappingEndEvent):
+                    name = _construct(loader, loader.compose_node(None, None))
+                    value = _construct(loader, loader.compose_node(None, None))
+
+                    if name in names:
+                        raise ValueError(
+                            f"Duplicate key '{name}' under '{key}' in "
+                            f"{file_path}"
+                        )
+                    names.add(name)
+
+                    yield name, value
+
+                loader.get_event()
+
+        finally:
+            loader.dispose()
+
+
+def deep_merge(base: dict, override: dict) -> dict:
+    """
+    Recursively merges two dictionaries, returning a new dictionary. Values in
+    override take precedence, nested dictionaries are merged key by key and 
+    any other values (including lists) are replaced.
+
+    :param base: Dictionary to merge into
+    :param override: Dictionary with the values to override
+    :returns: Merged dictionary
+    """
+
+    merged = dict(base)
+
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = deep_merge(merged[key], value)
+        else:
+            merged[key] = value
 
-    return yaml.safe_load(file)
+    return merged
@@ -1,12 +1,141 @@
 import argparse
+import importlib
 
-from . import clean, model, model_properties, package, source
+from . import params
 from .libs.logger import CustomLogger
-from .libs.profile import get_profile_name_from_current_project
+from .libs.shard import parse_shard
+from .libs.tracer import tracer
 
 logger = CustomLogger()
 
 
+def lazy_main(module_name: str):
+    """
+    Returns the main function of a sub-command module, which is only imported
+    when the sub-command runs. This keeps start up fast, as e.g. dbt and the
+    Snowflake connector are only imported by the sub-commands using them.
+
+    :param module_name: Name of the sub-command module (e.g. model)
+    """
+
+    def main(args):
+        module = importlib.import_module(f'.{module_name}', __package__)
+        return module.main(args)
+
+    main.command = module_name
+
+    return main
+
+
+def add_common_arguments(sub_parser):
+
+    sub_parser.add_argument(
+        "--trace",
+        help="Write a Chrome trace event file of the run (e.g. trace.json)",
+        type=str,
+        default=None,
+        required=False
+    )
+    sub_parser.add_argument(
+        "--yaml-cache",
+        help="Cache parsed YAML files in .dbtgen/.cache/ between runs",
+        const=True,
+        action='store_const',
+        default=False,
+        required=False
+    )
+    sub_parser.add_argument(
+        "-q",
+        "--quiet",
+        help="Only log failures and the summary, not the status of each item",
+        const=True,
+        action='store_const',
+        default=False,
+        required=False
+    )
+
+
+def parse_sink(value: str) -> str:
+    """
+    Checks a --sink value, used as an argparse type. Checked here rather than
+    by libs.sink, so that the archive modules are not imported on start up.
+    Sinks which keep files in memory are only available from the Python API,
+    as the CLI would discard them.
+
+    :param value: files, jsonl, or the path of a .tar, .tar.gz, .tgz or .zip
+        archive
+    """
+
+    if value in ('files', 'jsonl') \
+            or value.endswith(('.tar', '.tar.gz', '.tgz', '.zip')):
+        return value
+
+    raise argparse.ArgumentTypeError(
+        f"Sink must be files, jsonl, or the path of a .tar, .tar.gz, .tgz or "
+        f".zip archive, got '{value}'"
+    )
+
+
+def add_sink_arguments(sub_parser):
+
+    sub_parser.add_argument(
+        "--sink",
+        help="Where to write generated files: files (the working tree, by "
+             "default), jsonl (JSON lines on stdout) or the path of a .tar, "
+             ".tar.gz, .tgz or .zip archive",
+        type=parse_sink,
+        default='files',
+        required=False
+    )
+
+
+def add_shard_arguments(sub_parser):
+
+    sub_parser.add_argument(
+        "--shard",
+        help="Only generate the slice i of n of the outputs (e.g. 2/4), so "
+             "that n runners can each generate a disjoint slice",
+        type=parse_shard,
+        default=None,
+        required=False
+    )
+    sub_parser.add_argument(
+        "--shard-manifest",
+        help="File to write the shard's run summary and outputs to (by "
+             "default, .dbtgen/.shards/<command>-<i>-of-<n>.json)",
+        type=str,
+        default=None,
+        required=False
+    )
+
+
+def add_query_arguments(sub_parser):
+
+    sub_parser.add_argument(
+        "--chunk-size",
+        help="Number of objects queried per statement (default: 100)",
+        type=int,
+        default=100,
+        required=False
+    )
+    sub_parser.add_argument(
+        "--parallel-queries",
+        help="Number of statements running in the warehouse at once "
+             "(default: 4)",
+        type=int,
+        default=4,
+        required=False
+    )
+    sub_parser.add_argument(
+        "--query-timeout",
+        help="Seconds after which a statement is cancelled, and its objects "
+             "reported as failed",
+        type=float,
+        default=None,
+        required=False
+    )
+
+
 def build_model_subparser(sub_parsers):
 
     sub_parser = sub_parsers.add_parser(
@@ -35,13 +164,101 @@ def build_model_subparser(sub_parsers):
     sub_parser.add_argument(
         "-s",
         "--select",
-        help="Selected models",
+        help="Selected models: comma separated directories or models, which "
+             "may contain globs (e.g. staging.stg_*), prefixed with '!' to "
+             "exclude",
+        type=str,
+        default=None,
+        required=False
+    )
+    sub_parser.add_argument(
+        "-x",
+        "--exclude",
+        help="Excluded directories or models, comma separated",
+        type=str,
+        default=None,
+        required=False
+    )
+    sub_parser.add_argument(
+        "--threads",
+        help="Number of worker threads used to render and write models",
+        type=int,
+        default=1,
+        required=False
+    )
+    sub_parser.add_argument(
+        "--full-refresh",
+        help="Ignore the state of the previous run and re-render every model",
+        const=True,
+        action='store_const',
+        default=False,
+        required=False
+    )
+    sub_parser.add_argument(
+        "-w",
+        "--watch",
+        help="Watch .dbtgen/ and regenerate models affected by each change",
+        const=True,
+        action='store_const',
+        default=False,
+        required=False
+    )
+    sub_parser.add_argument(
+        "--changed-since",
+        help="Only generate models whose template or variables files changed "
+             "since a git ref (e.g. origin/main)",
+        type=str,
+        default=None,
+        required=False
+    )
+    sub_parser.add_argument(
+        "--stream-yaml",
+        help="Parse models.yml files one model at a time, so generation "
+             "starts before large files are fully parsed",
+        const=True,
+        action='store_const',
+        default=False,
+        required=False
+    )
+    sub_parser.add_argument(
+        "--prune",
+        help="Delete generated model files which no longer have a template "
+             "and models.yml entry (in compile mode, list them)",
+        const=True,
+        action='store_const',
+        default=False,
+        required=False
+    )
+    sub_parser.add_argument(
+        "--diff",
+        help="Print a unified diff of each new or changed model against the "
+             "existing file, without writing anything",
+        const=True,
+        action='store_const',
+        default=False,
+        required=False
+    )
+    sub_parser.add_argument(
+        "--progress",
+        help="Show a single progress line with throughput and ETA instead of "
+             "the status of each model",
+        const=True,
+        action='store_const',
+        default=False,
+        required=False
+    )
+    sub_parser.add_argument(
+        "--compile-output",
+        help="File to write the compiled models to in compile mode",
         type=str,
         default=None,
         required=False
     )
 
-    sub_parser.set_defaults(func=model.main)
+    add_shard_arguments(sub_parser)
+    add_sink_arguments(sub_parser)
+    add_common_arguments(sub_parser)
+    sub_parser.set_defaults(func=lazy_main('model'))
 
 
 def build_model_properties_subparser(sub_parsers):
@@ -62,9 +279,10 @@ def build_model_properties_subparser(sub_parsers):
     sub_parser.add_argument(
         "-p",
         "--profile",
-        help="Target dbt profile",
+        help="Target dbt profile (by default, the profile of the current "
+             "dbt project)",
         type=str,
-        default=get_profile_name_from_current_project(),
+        default=None,
         required=False
     )
     sub_parser.add_argument(
@@ -111,7 +329,10 @@ def build_model_properties_subparser(sub_parsers):
         required=False
     )
 
-    sub_parser.set_defaults(func=model_properties.main)
+    add_query_arguments(sub_parser)
+    add_sink_arguments(sub_parser)
+    add_common_arguments(sub_parser)
+    sub_parser.set_defaults(func=lazy_main('model_properties'))
 
 
 def build_source_subparser(sub_parsers):
@@ -141,9 +362,10 @@ def build_source_subparser(sub_parsers):
     sub_parser.add_argument(
         "-p",
         "--profile",
-        help="Target dbt profile",
+        help="Target dbt profile (by default, the profile of the current "
+             "dbt project)",
         type=str,
-        default=get_profile_name_from_current_project(),
+        default=None,
         required=False
     )
     sub_parser.add_argument(
@@ -164,7 +386,10 @@ def build_source_subparser(sub_parsers):
         required=False
     )
 
-    sub_parser.set_defaults(func=source.main)
+    add_query_arguments(sub_parser)
+    add_sink_arguments(sub_parser)
+    add_common_arguments(sub_parser)
+    sub_parser.set_defaults(func=lazy_main('source'))
 
 
 def build_package_subparser(sub_parsers):
@@ -175,7 +400,64 @@ def build_package_subparser(sub_parsers):
             "properties files"
     )
 
-    sub_parser.set_defaults(func=package.main)
+    add_shard_arguments(sub_parser)
+    add_sink_arguments(sub_parser)
+    add_common_arguments(sub_parser)
+    sub_parser.set_defaults(func=lazy_main('package'))
+
+
+def build_merge_subparser(sub_parsers):
+
+    sub_parser = sub_parsers.add_parser(
+        "merge", 
+        help="Merge the manifests of a sharded run"
+    )
+
+    sub_parser.add_argument(
+        "manifests",
+        help="Shard manifest files (by default, those in .dbtgen/.shards/ "
+             "for the command)",
+        nargs='*',
+        default=[]
+    )
+    sub_parser.add_argument(
+        "-c",
+        "--command",
+        help="Sub-command of the sharded run (model or package)",
+        type=str,
+        default='model',
+        required=False
+    )
+    sub_parser.add_argument(
+        "--output",
+        help="File to write the merged manifest to",
+        type=str,
+        default='manifest.json',
+        required=False
+    )
+
+    add_common_arguments(sub_parser)
+    sub_parser.set_defaults(func=lazy_main('merge'))
+
+
+def build_serve_subparser(sub_parsers):
+
+    sub_parser = sub_parsers.add_parser(
+        "serve", 
+        help="Serve render, compile and diff requests over a Unix socket"
+    )
+
+    sub_parser.add_argument(
+        "--socket",
+        help="Path of the Unix socket to listen on (default: "
+             ".dbtgen/.serve.sock)",
+        type=str,
+        default=None,
+        required=False
+    )
+
+    add_common_arguments(sub_parser)
+    sub_parser.set_defaults(func=lazy_main('serve'))
 
 
 def build_clean_subparser(sub_parsers):
@@ -194,7 +476,114 @@ def build_clean_subparser(sub_parsers):
         required=False
     )
 
-    sub_parser.set_defaults(func=clean.main)
+    add_common_arguments(sub_parser)
+    sub_parser.set_defaults(func=lazy_main('clean'))
+
+
+def build_bench_subparser(sub_parsers):
+
+    sub_parser = sub_parsers.add_parser(
+        "bench", 
+        help="Benchmark dbtgen against a synthetic project"
+    )
+
+    sub_parser.add_argument(
+        "--depth",
+        help="Number of nested directory levels in .dbtgen/",
+        type=int,
+        default=2,
+        required=False
+    )
+    sub_parser.add_argument(
+        "--width",
+        help="Number of sub-directories per directory",
+        type=int,
+        default=2,
+        required=False
+    )
+    sub_parser.add_argument(
+        "--templates",
+        help="Number of parameterised templates per directory",
+        type=int,
+        default=2,
+        required=False
+    )
+    sub_parser.add_argument(
+        "--static-templates",
+        help="Number of static templates per directory",
+        type=int,
+        default=1,
+        required=False
+    )
+    sub_parser.add_argument(
+        "--models",
+        help="Number of models defined in models.yml",
+        type=int,
+        default=100,
+        required=False
+    )
+    sub_parser.add_argument(
+        "--repeat",
+        help="Number of times to run each command (fastest is reported)",
+        type=int,
+        default=1,
+        required=False
+    )
+    sub_parser.add_argument(
+        "--output",
+        help="File to write the JSON results to (printed by default)",
+        type=str,
+        default=None,
+        required=False
+    )
+    sub_parser.add_argument(
+        "--baseline",
+        help="JSON results of a previous run to compare against",
+        type=str,
+        default=None,
+        required=False
+    )
+    sub_parser.add_argument(
+        "--budget",
+        help="Maximum allowed ratio of wall time / peak RSS to the baseline",
+        type=float,
+        default=1.2,
+        required=False
+    )
+
+    add_common_arguments(sub_parser)
+    sub_parser.set_defaults(func=lazy_main('bench'))
+
+
+def run(args):
+    """
+    Runs the selected sub-command, recording a trace if --trace is given,
+    caching parsed YAML files if --yaml-cache is given and only logging 
+    failures if --quiet is given
+    """
+
+    CustomLogger.quiet = args.quiet
+
+    if args.trace:
+        tracer.enable()
+
+    if args.yaml_cache:
+        from .libs import yaml_handler
+        yaml_handler.enable_cache(params.YAML_CACHE_DIR)
+
+    command = args.func.command
+    with tracer.span(f'dbtgen {command}', 'command'):
+        args.func(args)
+
+    if args.trace:
+        tracer.save(args.trace)
+        logger.info(f"Trace written to {args.trace}. Slowest spans:")
+        for event in tracer.slowest(10):
+            attributes = ', '.join(str(v) for v in event['args'].values())
+            logger.info(
+                f"  {event['dur'] / 1000:10.3f} ms | {event['name']} "
+                f"{attributes}"
+            )
 
 
 def cli():
@@ -206,12 +595,16 @@ def cli():
 
     build_model_subparser(subparsers)
 
+    build_package_subparser(subparsers)
+
     # TODO: Fix sub-commands
     # build_model_properties_subparser(subparsers)
     # build_source_subparser(subparsers)
-    # build_package_subparser(subparsers)
 
+    build_merge_subparser(subparsers)
+    build_serve_subparser(subparsers)
     build_clean_subparser(subparsers)
+    build_bench_subparser(subparsers)
 
     args = parser.parse_args()
 
@@ -220,11 +613,11 @@ def cli():
             f"""Specify one of the following sub-commands.
                 
             Commands:
-                model,model-properties,source,package,clean
+                model,model-properties,source,package,merge,serve,clean,bench
             """
         )
 
     else:
-        args.func(args)
+        run(args)
 
     logger.info('Finished')
@@ -0,0 +1,70 @@
+"""
+    Merges the manifests written by each shard of a sharded run (e.g.
+    dbtgen model --run --shard 2/4) into a single manifest and run summary,
+    equivalent to those of an unsharded run.
+
+    The state and ownership index entries recorded by each shard of a model
+    run are applied to .dbtgen/.state.json and .dbtgen/.outputs.json, which
+    shards do not write themselves.
+"""
+
+import json
+import os
+import sys
+from glob import glob
+
+from . import params
+from .libs.logger import CustomLogger
+from .libs.ownership import OwnershipIndex
+from .libs.shard import merge_manifests
+from .libs.state import State
+
+logger = CustomLogger()
+
+
+def main(args):
+
+    file_paths = args.manifests or sorted(
+        glob(f'{params.SHARDS_DIR}/{args.command}-*-of-*.json')
+    )
+    logger.info(f"Merging {len(file_paths)} shard manifests")
+
+    manifests = []
+    for file_path in file_paths:
+        with open(file_path, 'r') as f:
+            manifests.append(json.load(f))
+
+    try:
+        merged = merge_manifests(manifests)
+    except RuntimeError as e:
+        logger.status(str(e), 'FAILED')
+        sys.exit(1)
+
+    state_entries = merged.pop('state')
+    owners = merged.pop('owners')
+    pruned = merged.pop('pruned')
+
+    if merged['command'] == 'model' and (state_entries or owners or pruned):
+        state = State(params.STATE_FILE_PATH, params.PROJECT_ROOT)
+        index = OwnershipIndex(params.OUTPUTS_INDEX_PATH, params.PROJECT_ROOT)
+
+        state.update(state_entries)
+        index.update(owners)
+        for rel_path in pruned:
+            file_path = os.path.join(params.PROJECT_ROOT, rel_path)
+            state.remove(file_path)
+            index.remove(file_path)
+
+        state.save()
+        index.save()
+        logger.info("Updated the state and ownership index")
+
+    with open(args.output, 'w') as f:
+        json.dump(merged, f, indent=2, sort_keys=True)
+
+    label = 'Sources' if merged['command'] == 'package' else 'Models'
+
+    logger.info("")
+    for status, count in merged['counts'].items():
+        logger.info(f"{label} {status}: {count}")
+    logger.info(f"Merged manifest written to {args.output}")
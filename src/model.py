@@ -18,235 +18,1091 @@
     template *.sql file.
 """
 
+import difflib
 import os
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-import string
+from functools import cached_property
+from typing import Callable, Iterable, Iterator, TextIO
 
 from . import params
-from .libs import node
+from .libs import git, node, scanner
 from .libs.file_handler import read_file
-from .libs.logger import CustomLogger
-from .libs.yaml_handler import read_yaml_file
+from .libs.logger import CustomLogger, Progress
+from .libs.ownership import OwnershipIndex
+from .libs.project import Project
+from .libs.resolver import LayeredYamlResolver
+from .libs.selector import NameSet, Selector
+from .libs.shard import in_shard, manifest_path, write_manifest
+from .libs.sink import FileSystemSink, create_sink
+from .libs.state import State, hash_contents, hash_variables
+from .libs.tracer import tracer
+from .libs.template import (CompiledTemplate, compile_file_name_pattern,
+                            compile_template)
+from .libs.watcher import create_watcher
+from .libs.yaml_handler import deep_merge, stream_yaml_mapping
 
 logger = CustomLogger()
-counts = {'created': 0, 'skipped': 0}
+
+# The project in the working directory, used by the CLI
+DEFAULT_PROJECT = Project(params.PROJECT_ROOT)
+
+# Statuses of the model files written by dbtgen (in this or a previous run),
+# rather than existing files which were skipped
+OWNED_STATUSES = ('CREATED', 'UNCHANGED')
 
 
 @dataclass
 class Model:
     """
     Class to format and write the contents of a (.sql) model file to a dbt 
-    project.
+    project. The file name, namespace and contents are computed once per 
+    model and cached.
 
     :param name: The name of the model
     :param yaml_contents: Dictionary with model variables
-    :param sql: Template SQL file to be formatted
+    :param template: Compiled template SQL file to be formatted
     :param file_name_pattern: Naming pattern for the target model file
+    :param dependencies: Paths of the files the model is generated from (the
+        template and the models.yml/ignore.yml files applied to it)
+    :param project: Project the model belongs to (by default, the project in
+        the working directory)
     """
 
     name: str
     target_dir: str
     file_name_pattern: str
     yaml_contents: dict
-    sql: str
+    template: CompiledTemplate
+    dependencies: tuple = ()
+    project: Project = None
 
-    @property
+    @cached_property
     def file_name(self) -> str:
-        return self.file_name_pattern.format(
+        return compile_file_name_pattern(self.file_name_pattern).render(
             name=self.name, **self.yaml_contents
         )
 
-    @property
+    @cached_property
     def full_name(self) -> str:
+        project = self.project or DEFAULT_PROJECT
+
         return node.namespace(
             os.path.abspath(f'{self.target_dir}/{self.file_name}')
-            .replace(params.TARGET_MODELS_DIR, '')
+            .replace(project.target_dir, '')
             .replace('.sql', '')
         )
 
-    @property
+    @cached_property
+    def output_path(self) -> str:
+        """
+        Path to the model file, relative to the project root
+        """
+
+        return os.path.relpath(
+            os.path.join(self.target_dir, self.file_name),
+            (self.project or DEFAULT_PROJECT).root_dir
+        )
+
+    @cached_property
+    def variables_hash(self) -> str:
+        return hash_variables({'name': self.name, **self.yaml_contents})
+
+    @cached_property
     def contents(self) -> str:
-        return string.Template(self.sql).substitute(name=self.name, **self.yaml_contents)
+        with tracer.span('render', 'render', model=self.full_name):
+            return self.template.render(name=self.name, **self.yaml_contents)
 
-    @property
-    def contents_print_format(self) -> str:
-        return self.contents_print_format
+    def contents_print_lines(self) -> Iterator[str]:
+        """
+        Yields the compiled contents of a dbt model, line by line with line 
+        numbers, to be streamed to the terminal or a file.
+        """
 
-    @contents_print_format.getter
+        yield '    ------------------------------\n'
+        yield '\n'
+
+        for line_no, line in enumerate(self.contents.splitlines(), start=1):
+            yield f'    {line_no: >3d} | {line}\n'
+
+        yield '\n'
+        yield '    ------------------------------\n'
+
+    @property
     def contents_print_format(self) -> str:
         """
         Get the compiled contents of a dbt model to be printed to the terminal.
         """
 
-        body = f'Contents:' \
-               '\n    ------------------------------' \
-               '\n'
+        return 'Contents:\n' + ''.join(self.contents_print_lines()).rstrip('\n')
 
-        count = 0
-        for line in self.contents.splitlines():
-            count += 1
-            line_no = '{: >3d}'.format(count)
-            body += f'\n    {line_no} | {line}'
-
-        body += '\n' \
-                '\n    ------------------------------'
+    def clear_contents(self) -> None:
+        """
+        Frees the rendered contents once they have been written or printed, 
+        so memory does not grow with the number of models.
+        """
 
-        return body
+        self.__dict__.pop('contents', None)
 
     def write_file(
             self,
-            overwrite: bool = False
-    ) -> None:
+            overwrite: bool = False,
+            state: State = None,
+            sink: FileSystemSink = None
+    ) -> str:
         """
-        Writes the contents of the model file to a target directory
+        Writes the contents of the model file to a target directory. Safe to 
+        call from worker threads, logging is left to the caller so that output
+        order does not depend on thread scheduling.
+
+        :param overwrite: If True, overwrite an existing model file
+        :param state: State of the previous run. Models whose template and 
+            variables are unchanged are neither rendered nor rewritten. Models
+            whose rendered contents match the existing file are not rewritten
+        :param sink: Where the model file is written (by default, the working
+            tree). Shared between models, so that e.g. each target directory
+            is only created or listed once
+        :returns: The status of the model (CREATED, SKIPPED or UNCHANGED)
         """
 
-        if not os.path.exists(self.target_dir):
-            os.makedirs(self.target_dir)
+        sink = sink or FileSystemSink()
 
-        file_path = f'{self.target_dir}/{self.file_name}'
+        with tracer.span('write_model', 'model', model=self.full_name):
+            file_path = os.path.join(self.target_dir, self.file_name)
+            exists = sink.exists(file_path)
 
-        if not os.path.exists(file_path) or overwrite:
-            with open(file_path, 'w') as model_file:
-                model_file.write(self.contents)
-                model_file.close()
-            logger.status(self.full_name, 'CREATED')
-            counts['created'] += 1
+            if exists and not overwrite:
+                status = 'SKIPPED'
 
-        else:
-            logger.status(self.full_name, 'SKIPPED')
-            counts['skipped'] += 1
+            elif exists and state and state.is_unchanged(
+                    file_path, self.template.hash, self.variables_hash):
+                status = 'UNCHANGED'
+
+            else:
+                contents = self.contents
+                written = sink.write(file_path, contents, exists)
+                if state:
+                    state.record(
+                        file_path,
+                        self.template.hash,
+                        self.variables_hash,
+                        hash_contents(contents)
+                    )
+                status = 'CREATED' if written else 'UNCHANGED'
+
+        return status
 
 
 def generate_models(
         models: dict,
         ignored: dict,
-        template: str,
+        template: CompiledTemplate,
         target_dir: str,
         file_name_pattern: str,
-        execute_mode: bool,
-        overwrite_mode: bool
-) -> None:
+        dependencies: tuple = (),
+        project: Project = None
+) -> Iterator[Model]:
     """
-    Generates objects of the Model class. For each definition and set of model 
-    variables, instantiates an object and calls the class method to write the 
-    contents to a .sql file.
+    Generates objects of the Model class, one for each definition and set of 
+    model variables which is not ignored. Ignored models (which may be glob
+    patterns, e.g. stg_*_old) are looked up in a set.
     """
 
-    for model_name in models['models']:
-        if not ignored or model_name not in ignored.get('models'):
+    ignored_models = NameSet((ignored or {}).get('models'))
 
-            model = Model(
+    for model_name, variables in models['models'].items():
+        if model_name not in ignored_models:
+            yield Model(
                 model_name,
                 target_dir,
                 file_name_pattern,
-                models['models'][model_name],
-                template
+                variables,
+                template,
+                dependencies,
+                project
             )
 
+
+def ordered_map(
+        func: Callable,
+        items: Iterable,
+        threads: int = 1
+) -> Iterator[tuple]:
+    """
+    Applies a function to each item using a pool of worker threads, yielding
+    (item, result) pairs in the order of the items. At most 2 items per 
+    thread are in flight at once, so results are not accumulated when the 
+    consumer is slower than the workers.
+
+    :param func: Function to apply to each item
+    :param items: Items to process (may be a generator)
+    :param threads: Number of worker threads. With a single thread, items
+        are processed in the calling thread, without a pool
+    """
+
+    if threads <= 1:
+        for item in items:
+            yield item, func(item)
+        return
+
+    pending = deque()
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for item in items:
+            pending.append((item, executor.submit(func, item)))
+
+            if len(pending) >= threads * 2:
+                item, future = pending.popleft()
+                yield item, future.result()
+
+        while pending:
+            item, future = pending.popleft()
+            yield item, future.result()
+
+
+def run_models(
+        models: Iterable[Model],
+        execute_mode: bool,
+        overwrite_mode: bool,
+        threads: int = 1,
+        state: State = None,
+        compile_output: TextIO = None,
+        progress: Progress = None,
+        outputs: dict = None,
+        sink: FileSystemSink = None,
+        index: OwnershipIndex = None
+) -> dict:
+    """
+    Renders (and in execute mode, writes) every model using a pool of worker 
+    threads. Results are logged in the order the models were generated, so 
+    the console output is the same regardless of the number of threads.
+
+    In compile mode, the contents of each model are streamed line by line to
+    the log handler, or to compile_output if given.
+
+    :param models: Models to be rendered
+    :param execute_mode: If True, write the model files
+    :param overwrite_mode: If True, overwrite existing model files
+    :param threads: Number of worker threads
+    :param state: State of the previous run, used to skip unchanged models
+    :param compile_output: File to stream compiled contents to
+    :param progress: If given, report progress on a single line rather than
+        logging the status of each model
+    :param outputs: If given, the status of each model is recorded in it, by
+        output path
+    :param sink: Where model files are written (by default, the working tree)
+    :param index: If given, the template and models.yml entry of each model
+        file written by dbtgen is recorded in it (in execute mode)
+    :returns: Number of models created, skipped and unchanged
+    """
+
+    sink = sink or FileSystemSink()
+    run_counts = {'created': 0, 'skipped': 0, 'unchanged': 0}
+
+    def process(model: Model) -> str:
+        if execute_mode:
+            return model.write_file(overwrite_mode, state, sink)
+        return model.contents
+
+    for model, result in ordered_map(process, models, threads):
+        if outputs is not None:
+            outputs[model.output_path] = result if execute_mode else 'COMPILED'
+
+        if progress:
+            progress.update(result if execute_mode else None)
+        else:
             logger.status(model.full_name, 'RUN')
-            if execute_mode:
-                model.write_file(overwrite_mode)
-            else:
-                logger.info(model.contents_print_format)
+
+        if execute_mode:
+            run_counts[result.lower()] += 1
+            if index is not None and result in OWNED_STATUSES:
+                index.record(
+                    os.path.join(model.target_dir, model.file_name),
+                    model.dependencies[0],
+                    model.name
+                )
+            if not progress:
+                logger.status(model.full_name, result)
+        elif compile_output:
+            compile_output.write(f'{model.full_name}\n')
+            compile_output.writelines(model.contents_print_lines())
+        else:
+            logger.info('Contents:')
+            logger.stream(model.contents_print_lines())
+
+        model.clear_contents()
+
+    return run_counts
+
+
+def diff_model(model: Model) -> tuple:
+    """
+    Renders a model and compares it with the existing model file. Safe to 
+    call from worker threads.
+
+    :param model: Model to be compared
+    :returns: The status of the model (NEW, CHANGED or UNCHANGED) and the 
+        lines of a unified diff from the existing file to the rendered model
+    """
+
+    file_path = os.path.join(model.target_dir, model.file_name)
+    rel_path = model.output_path
+
+    try:
+        existing = read_file(file_path)
+    except FileNotFoundError:
+        existing = None
+
+    contents = model.contents
+
+    if existing == contents:
+        return 'UNCHANGED', []
+
+    diff = difflib.unified_diff(
+        existing.splitlines(keepends=True) if existing is not None else [],
+        contents.splitlines(keepends=True),
+        fromfile=f'a/{rel_path}' if existing is not None else '/dev/null',
+        tofile=f'b/{rel_path}'
+    )
+
+    return (
+        'NEW' if existing is None else 'CHANGED',
+        [line if line.endswith('\n') else line + '\n' for line in diff]
+    )
+
+
+def has_source(
+        file_path: str,
+        template_path: str,
+        model_name: str,
+        project: Project = None
+) -> bool:
+    """
+    Whether a model file would still be generated from the template and
+    models.yml entry recorded for it in the ownership index
+
+    :param file_path: Path to the model file
+    :param template_path: Path to the template it was generated from
+    :param model_name: Name of the models.yml entry it was generated from
+    :param project: Project the model file belongs to
+    """
+
+    project = project or DEFAULT_PROJECT
+
+    if not os.path.isfile(template_path):
+        return False
+
+    dir_path, template_name = os.path.split(template_path)
+    model_dir = os.path.normpath(os.path.join(
+        project.target_dir,
+        os.path.relpath(dir_path, project.input_dir)
+    ))
+    params_in_filename = [
+        part[1] for part in compile_file_name_pattern(template_name).parts
+        if part[1] is not None
+    ]
+
+    if not params_in_filename:
+        return file_path == os.path.join(model_dir, template_name)
+
+    models = get_models_yml(dir_path, project=project).get('models') or {}
+    ignored_models = NameSet(
+        (get_models_yml(dir_path, 'ignore.yml', project) or {}).get('models')
+    )
+
+    if model_name not in models or model_name in ignored_models:
+        return False
+
+    model = Model(model_name, model_dir, template_name, models[model_name],
+                  template=None, project=project)
+
+    try:
+        return file_path == os.path.join(model.target_dir, model.file_name)
+    except (KeyError, IndexError, AttributeError, TypeError):
+        return False
+
+
+def find_orphans(
+        index: OwnershipIndex,
+        selector: Selector = None,
+        shard: tuple = None,
+        project: Project = None
+) -> list:
+    """
+    Returns the model files recorded in the ownership index which no longer
+    have a source template and models.yml entry, e.g. after a model is 
+    removed from models.yml or a template is renamed. Files which no longer
+    exist are removed from the index.
+
+    :param index: Ownership index of the files generated by previous runs
+    :param selector: Compiled --select value, which the files are limited to
+    :param shard: If given, only files belonging to the shard are returned
+    :param project: Project the index belongs to
+    """
+
+    selector = selector or Selector()
+    project = project or DEFAULT_PROJECT
+    target_dir = project.target_dir
+    orphans = []
+
+    for file_path, template_path, model_name in index.owned():
+        if not os.path.exists(file_path):
+            index.remove(file_path)
+            continue
+
+        if os.path.commonpath([file_path, target_dir]) != target_dir:
+            continue
+
+        full_name = node.namespace(
+            os.path.splitext(file_path)[0].replace(target_dir, '')
+        )
+        rel_path = os.path.relpath(file_path, project.root_dir)
+
+        if selector.matches(full_name) and in_shard(rel_path, shard) \
+                and not has_source(file_path, template_path, model_name,
+                                   project):
+            orphans.append(file_path)
+
+    return orphans
+
+
+def prune_models(
+        orphans: list,
+        execute_mode: bool,
+        index: OwnershipIndex,
+        state: State = None
+) -> None:
+    """
+    Deletes (in execute mode) or lists the orphaned model files, and removes
+    deleted files from the ownership index and state
+
+    :param orphans: Paths of the orphaned model files
+    :param execute_mode: If True, delete the files
+    :param index: Ownership index the files were found in
+    :param state: State of the previous run, if loaded
+    """
+
+    for file_path in orphans:
+        rel_path = os.path.relpath(file_path, index.root_dir)
+
+        if execute_mode:
+            os.remove(file_path)
+            index.remove(file_path)
+            if state:
+                state.remove(file_path)
+            logger.status(rel_path, 'PRUNED')
+        else:
+            logger.status(rel_path, 'ORPHANED')
+
+
+def diff_models(
+        models: Iterable[Model],
+        threads: int = 1,
+        selector: Selector = None,
+        shard: tuple = None,
+        progress: Progress = None,
+        project: Project = None
+) -> dict:
+    """
+    Renders every model using a pool of worker threads and streams a unified
+    diff against the existing model file for each model which is new or 
+    changed. Nothing is written.
+
+    :param models: Models to be compared
+    :param threads: Number of worker threads
+    :param selector: Compiled --select value, used to find orphaned files
+    :param shard: If given, only orphaned files belonging to the shard are
+        reported
+    :param progress: If given, report progress on a single line
+    :param project: Project the models belong to
+    :returns: Number of new, changed, unchanged and orphaned model files
+    """
+
+    project = project or DEFAULT_PROJECT
+
+    diff_counts = {'new': 0, 'changed': 0, 'unchanged': 0, 'orphaned': 0}
+
+    for model, (status, diff) in ordered_map(diff_model, models, threads):
+        diff_counts[status.lower()] += 1
+
+        if progress:
+            progress.update(status)
+        if diff:
+            logger.stream(diff)
+
+        model.clear_contents()
+
+    index = OwnershipIndex(project.outputs_index_path, project.root_dir)
+
+    for file_path in find_orphans(index, selector, shard, project):
+        diff_counts['orphaned'] += 1
+        logger.status(
+            os.path.relpath(file_path, project.root_dir),
+            'ORPHANED'
+        )
+
+    return diff_counts
+
+
+def get_resolver(
+        models_file: str = 'models.yml',
+        project: Project = None
+) -> LayeredYamlResolver:
+    """
+    Returns the resolver for a variables file (e.g. models.yml, ignore.yml),
+    which is kept for the lifetime of the project
+
+    :param models_file: Name of the variables file
+    :param project: Project of the .dbtgen tree (by default, the project in
+        the working directory)
+    """
+
+    return (project or DEFAULT_PROJECT).get_resolver(models_file)
 
 
 def get_models_yml(
         dir_path: str,
-        models_file: str = 'models.yml'
+        models_file: str = 'models.yml',
+        project: Project = None
 ) -> dict:
+    """
+    Returns the variables file (e.g. models.yml, ignore.yml) for a directory,
+    deep merged over those found in its parent directories. Each file is only
+    parsed once, unless it is modified.
 
-    try:
-        yml = read_yaml_file(f'{dir_path}/{models_file}')
+    :param dir_path: Path to the template directory
+    :param models_file: Name of the variables file
+    :param project: Project of the .dbtgen tree
+    """
 
-    except FileNotFoundError:
+    return get_resolver(models_file, project).resolve(dir_path)
 
-        # If no models file found, traverse through parent directories to find one
-        yml = {}
-        parent_dir = dir_path
 
-        while os.path.abspath(parent_dir) != params.PROJECT_ROOT:
-            parent_dir += '../'
-            try:
-                yml = read_yaml_file(f'{parent_dir}/{models_file}')
-                break
-            except FileNotFoundError:
-                pass
+def stream_models_yml(
+        dir_path: str,
+        project: Project = None
+) -> Iterator[tuple]:
+    """
+    Yields the (model name, variables) pairs of the models.yml for a 
+    directory as the nearest models.yml is parsed, rather than after the 
+    whole file has been read. Those found in its parent directories are deep
+    merged into each entry, as in get_models_yml, and models only defined in
+    parent directories are yielded last.
 
-    return yml
+    :param dir_path: Path to the template directory
+    :param project: Project of the .dbtgen tree
+    """
 
+    resolver = get_resolver(project=project)
+    layers = resolver.layers(dir_path)
 
-def main(args):
-    
-    for root, sub_dirs, files in os.walk(params.INPUT_MODELS_DIR):
-        for sub_dir in sub_dirs:
+    if not layers:
+        return
+
+    # Fragments (e.g. models.d/) are merged in full, so are not streamed
+    if os.path.basename(os.path.dirname(layers[-1])) \
+            == resolver.fragment_dir_name:
+        yield from (resolver.resolve(dir_path).get('models') or {}).items()
+        return
+
+    parent_models = {}
+    if len(layers) > 1:
+        parent_dir = os.path.dirname(os.path.dirname(layers[-1]))
+        parent_models = resolver.resolve(parent_dir).get('models') or {}
+
+    streamed = set()
+
+    for model_name, variables in stream_yaml_mapping(layers[-1], 'models'):
+        streamed.add(model_name)
+
+        base = parent_models.get(model_name)
+        if isinstance(base, dict) and isinstance(variables, dict):
+            variables = deep_merge(base, variables)
+
+        yield model_name, variables
+
+    for model_name, variables in parent_models.items():
+        if model_name not in streamed:
+            yield model_name, variables
 
-            sub_dir_path = os.path.join(root, sub_dir)
-            sub_dir_namespace = node.namespace(
-                sub_dir_path.replace(params.INPUT_MODELS_DIR, 'models')
+
+def find_models(
+        selector: Selector = None,
+        within: str = None,
+        stream: bool = False,
+        project: Project = None
+) -> Iterator[Model]:
+    """
+    Scans the .dbtgen tree and yields a Model for every selected template 
+    and set of model variables, as the tree is scanned. Models are matched 
+    against the selector by name before being rendered.
+
+    :param selector: Compiled --select value (e.g. staging.stg_account)
+    :param within: Node namespace (e.g. staging) the scan is limited to
+    :param stream: If True, models.yml files are parsed one model at a time
+        and each model is yielded as soon as it is parsed, for every 
+        parameterised template in the directory (rather than template by 
+        template)
+    :param project: Project of the .dbtgen tree (by default, the project in
+        the working directory)
+    """
+
+    selector = selector or Selector()
+    project = project or DEFAULT_PROJECT
+    resolvers = {
+        models_file: project.get_resolver(models_file)
+        for models_file in scanner.VARIABLE_FILES
+    }
+
+    for resolver in resolvers.values():
+        resolver.clear_stats()
+
+    for scanned_dir in scanner.scan(project.input_dir, selector, within):
+
+        # Reuse the stats from the scan, rather than stat every layer again
+        for models_file, resolver in resolvers.items():
+            entry = scanned_dir.variable_files.get(models_file)
+            resolver.set_stat(
+                os.path.join(scanned_dir.path, models_file),
+                entry.stat() if entry else None
+            )
+            resolver.set_fragments(
+                scanned_dir.path,
+                scanned_dir.fragments.get(models_file, [])
             )
-            
-            if not args.select \
-                or sub_dir_namespace.startswith(args.select + '.') \
-                or sub_dir_namespace == args.select:
-
-                models_yml = get_models_yml(sub_dir_path)
-                ignore_yml = get_models_yml(sub_dir_path, 'ignore.yml')
-                print(ignore_yml)
-
-                try:
-                    model_dir = os.path.abspath(
-                        sub_dir_path.replace(
-                            params.INPUT_MODELS_DIR,
-                            params.TARGET_MODELS_DIR
-                        )
-                    )
 
-                    for file in os.listdir(sub_dir_path):
-                        if file.endswith('.sql'):
-
-                            filename = os.path.join(sub_dir_path, file)
-                            template_sql = read_file(
-                                filename,
-                                allow_empty=False
-                            )
-                            params_in_filename = [
-                                tup[1] for tup in string.Formatter().parse(filename) \
-                                    if tup[1] is not None
-                            ]
-
-                            if params_in_filename:
-                                generate_models(
-                                    models_yml,
-                                    ignore_yml,
-                                    template_sql,
-                                    model_dir,
-                                    file,
-                                    args.run,
-                                    args.overwrite
-                                )
-
-                            else:
-                                logger.status(file, 'RUN')
-                                model = Model(
-                                    file, 
-                                    model_dir, 
-                                    file, 
-                                    yaml_contents={}, 
-                                    sql=template_sql
-                                )
-                                if args.run:
-                                    model.write_file(args.overwrite)
-                                else:
-                                    logger.info(model.contents_print_format)
-
-                except FileNotFoundError:
-                    pass
+        if not scanned_dir.selected:
+            continue
 
-    if args.run:
+        with tracer.span('resolve_variables', 'yaml',
+                         directory=scanned_dir.namespace):
+            models_yml = None if stream \
+                else resolvers['models.yml'].resolve(scanned_dir.path)
+            ignore_yml = resolvers['ignore.yml'].resolve(scanned_dir.path)
+        model_dir = os.path.join(project.target_dir, scanned_dir.rel_path)
+        variable_files = [
+            file_path
+            for resolver in resolvers.values()
+            for file_path in resolver.layers(scanned_dir.path)
+        ]
+        streamed_templates = []
+
+        for entry in scanned_dir.templates:
+
+            template = compile_template(
+                read_file(entry.path, allow_empty=False)
+            )
+            params_in_filename = [
+                part[1] for part in \
+                    compile_file_name_pattern(entry.name).parts \
+                    if part[1] is not None
+            ]
+
+            if params_in_filename and stream:
+                streamed_templates.append((entry, template))
+                continue
+
+            if params_in_filename:
+                models = generate_models(
+                    models_yml,
+                    ignore_yml,
+                    template,
+                    model_dir,
+                    entry.name,
+                    (entry.path, *variable_files),
+                    project
+                )
+
+            else:
+                models = [Model(
+                    entry.name, 
+                    model_dir, 
+                    entry.name, 
+                    yaml_contents={}, 
+                    template=template,
+                    dependencies=(entry.path,),
+                    project=project
+                )]
+
+            for model in models:
+                if selector.matches(model.full_name):
+                    yield model
+
+        if not streamed_templates:
+            continue
+
+        ignored_models = NameSet((ignore_yml or {}).get('models'))
+
+        for model_name, variables in stream_models_yml(
+                scanned_dir.path, project):
+            if model_name in ignored_models:
+                continue
+
+            for entry, template in streamed_templates:
+                model = Model(
+                    model_name,
+                    model_dir,
+                    entry.name,
+                    variables,
+                    template,
+                    (entry.path, *variable_files),
+                    project
+                )
+                if selector.matches(model.full_name):
+                    yield model
+
+
+def log_summary(
+        execute_mode: bool,
+        run_counts: dict,
+        progress: Progress = None
+) -> None:
+    """
+    Logs the summary counts at the end of a run
+
+    :param execute_mode: If True, the models were written (run mode)
+    :param run_counts: Number of models created, skipped and unchanged
+    :param progress: Progress of the run, closed and logged with its total 
+        time and throughput
+    """
+
+    if progress:
+        logger.info(progress.close())
+
+    if execute_mode:
         logger.info("")
-        logger.info(f"Models created: {counts['created']}")
-        logger.info(f"Models skipped: {counts['skipped']}")
+        logger.info(f"Models created: {run_counts['created']}")
+        logger.info(f"Models skipped: {run_counts['skipped']}")
+        logger.info(f"Models unchanged: {run_counts['unchanged']}")
     else:
         logger.info("Compile mode only - no model files created. "
                     "To execute, pass the CLI flag '--run'")
+
+
+def changed_namespaces(
+        changed_paths: set,
+        selector: Selector = None,
+        project: Project = None
+) -> list:
+    """
+    Maps changed files in the .dbtgen tree to the namespaces of the
+    directories which need to be scanned again. A changed template or
+    variables file affects its directory and all nested directories.
+
+    :param changed_paths: Paths of created, modified or deleted files
+    :param selector: Compiled --select value. Directories which cannot 
+        contain a selected model are left out
+    :param project: Project of the .dbtgen tree
+    :returns: Namespaces to scan, where None is the whole tree
+    """
+
+    selector = selector or Selector()
+    root_dir = os.path.abspath((project or DEFAULT_PROJECT).input_dir)
+    rel_dirs = set()
+
+    for path in changed_paths:
+        rel_path = os.path.relpath(path, root_dir)
+
+        if os.path.basename(path) in scanner.FRAGMENT_DIRS:
+            rel_dirs.add(os.path.dirname(rel_path))
+        elif os.path.isdir(path):
+            rel_dirs.add('' if rel_path == '.' else rel_path)
+        elif path.endswith('.sql') \
+                or os.path.basename(path) in scanner.VARIABLE_FILES:
+            rel_dirs.add(os.path.dirname(rel_path))
+        elif os.path.basename(os.path.dirname(path)) in scanner.FRAGMENT_DIRS:
+            rel_dirs.add(os.path.dirname(os.path.dirname(rel_path)))
+
+    namespaces = set()
+
+    for rel_dir in rel_dirs:
+        namespace = rel_dir.replace(os.sep, '.')
+
+        if not namespace:
+            return [None]
+        if selector.may_contain(namespace):
+            namespaces.add(namespace)
+
+    # Nested namespaces are already covered by their parent
+    return sorted(
+        namespace for namespace in namespaces
+        if not any(
+            namespace.startswith(other + '.') for other in namespaces
+        )
+    )
+
+
+def find_changed_models(
+        changed_paths: set,
+        selector: Selector = None,
+        stream: bool = False,
+        project: Project = None
+) -> Iterator[Model]:
+    """
+    Yields only the models generated from the changed files, by scanning the
+    directories containing them and checking each model's dependencies.
+
+    A model's dependencies only include the variable files which exist, so a
+    deleted models.yml, ignore.yml or fragment would not match any model
+    (e.g. one it ignored, or one falling back to a parent models.yml). Every
+    model in the directories affected by a changed variable file or fragment
+    is therefore yielded.
+
+    :param changed_paths: Absolute paths of changed files
+    :param selector: Compiled --select value
+    :param stream: If True, parse models.yml files one model at a time
+    :param project: Project of the .dbtgen tree
+    """
+
+    project = project or DEFAULT_PROJECT
+    root_dir = os.path.abspath(project.input_dir)
+    changed_paths = {
+        path for path in changed_paths
+        if os.path.commonpath([path, root_dir]) == root_dir
+    }
+
+    variable_paths = {
+        path for path in changed_paths
+        if os.path.basename(path) in scanner.VARIABLE_FILES
+        or os.path.basename(path) in scanner.FRAGMENT_DIRS
+        or os.path.basename(os.path.dirname(path)) in scanner.FRAGMENT_DIRS
+    }
+    variable_namespaces = changed_namespaces(variable_paths, selector, project)
+
+    def in_variable_namespace(model: Model) -> bool:
+        rel_dir = os.path.relpath(
+            os.path.dirname(model.dependencies[0]), root_dir
+        )
+        namespace = '' if rel_dir == '.' else rel_dir.replace(os.sep, '.')
+
+        return any(
+            other is None or namespace == other
+            or namespace.startswith(other + '.')
+            for other in variable_namespaces
+        )
+
+    for namespace in changed_namespaces(changed_paths, selector, project):
+        for model in find_models(selector, namespace, stream, project):
+            if changed_paths.intersection(model.dependencies) \
+                    or in_variable_namespace(model):
+                yield model
+
+
+def watch(args) -> None:
+    """
+    Generates the selected models, then watches the .dbtgen tree and 
+    regenerates only the models affected by each change: the models of an 
+    edited template, or the entries of an edited models.yml whose variables
+    changed. New directories are picked up automatically.
+    """
+
+    state = None
+    if args.run and not args.full_refresh:
+        state = State(params.STATE_FILE_PATH, params.PROJECT_ROOT)
+
+    index = None
+    if args.run:
+        index = OwnershipIndex(params.OUTPUTS_INDEX_PATH, params.PROJECT_ROOT)
+
+    selector = Selector(args.select, args.exclude)
+    generated = {}
+
+    def changed_models(namespaces: list) -> Iterator[Model]:
+        for namespace in namespaces:
+            for model in find_models(selector, namespace, args.stream_yaml):
+                file_path = os.path.join(model.target_dir, model.file_name)
+                signature = (model.template.hash, model.variables_hash)
+
+                if generated.get(file_path) != signature:
+                    generated[file_path] = signature
+                    yield model
+
+    def regenerate(namespaces: list) -> None:
+        models = changed_models(namespaces)
+        progress = None
+        if args.progress:
+            models = list(models)
+            progress = Progress(len(models))
+        run_counts = run_models(
+            models,
+            args.run,
+            args.overwrite,
+            args.threads,
+            state,
+            progress=progress,
+            index=index
+        )
+        if state:
+            state.save()
+        if index is not None:
+            index.save()
+        log_summary(args.run, run_counts, progress)
+
+    regenerate([None])
+
+    watcher = create_watcher(params.INPUT_MODELS_DIR)
+    logger.info(f"Watching {params.INPUT_MODELS_DIR} for changes "
+                "(press Ctrl+C to stop)")
+
+    try:
+        while True:
+            namespaces = changed_namespaces(watcher.changes(), selector)
+            if namespaces:
+                logger.info("")
+                logger.info("Changes detected, regenerating models")
+                regenerate(namespaces)
+
+    except KeyboardInterrupt:
+        logger.info("Stopped watching")
+
+    finally:
+        watcher.close()
+
+
+def watch_conflicts(args) -> list:
+    """
+    Returns the options given which watch mode does not support
+    """
+
+    conflicts = {
+        '--diff': args.diff,
+        '--changed-since': args.changed_since,
+        '--prune': args.prune,
+        '--shard': args.shard,
+        '--shard-manifest': args.shard_manifest,
+        '--compile-output': args.compile_output,
+        '--sink': args.sink not in (None, 'files'),
+    }
+
+    return [option for option, given in conflicts.items() if given]
+
+
+def main(args):
+
+    if args.watch:
+        conflicts = watch_conflicts(args)
+        if conflicts:
+            logger.status(
+                f"--watch cannot be combined with {', '.join(conflicts)}",
+                'FAILED'
+            )
+            sys.exit(1)
+        return watch(args)
+
+    selector = Selector(args.select, args.exclude)
+
+    if args.changed_since:
+        changed_paths = git.changed_files(args.changed_since)
+        logger.info(f"Selecting models changed since {args.changed_since} "
+                    f"({len(changed_paths)} changed files)")
+        models = find_changed_models(
+            changed_paths, selector, args.stream_yaml
+        )
+    else:
+        models = find_models(selector, stream=args.stream_yaml)
+
+    if args.shard:
+        models = (
+            model for model in models if in_shard(model.output_path, args.shard)
+        )
+
+    progress = None
+    if args.progress:
+        # Models are collected up front, so that the total (and an ETA) is known
+        models = list(models)
+        progress = Progress(len(models))
+
+    if args.diff:
+        diff_counts = diff_models(
+            models,
+            args.threads,
+            selector,
+            args.shard,
+            progress=progress
+        )
+        if progress:
+            logger.info(progress.close())
+        logger.info("")
+        for status, count in diff_counts.items():
+            logger.info(f"Models {status}: {count}")
+        return
+
+    # Only files written to the working tree are recorded in the state
+    sink = create_sink(args.sink if args.run else None, params.PROJECT_ROOT)
+
+    state = None
+    if args.run and not args.full_refresh and sink.persistent:
+        state = State(params.STATE_FILE_PATH, params.PROJECT_ROOT)
+
+    index = None
+    if sink.persistent:
+        index = OwnershipIndex(params.OUTPUTS_INDEX_PATH, params.PROJECT_ROOT)
+
+    outputs = {} if args.shard else None
+
+    if args.compile_output and not args.run:
+        with open(args.compile_output, 'w') as compile_output:
+            run_counts = run_models(models, False, False, args.threads, None,
+                                    compile_output, progress, outputs)
+    else:
+        try:
+            run_counts = run_models(
+                models, args.run, args.overwrite, args.threads, state,
+                progress=progress, outputs=outputs, sink=sink,
+                index=index if args.run else None
+            )
+        finally:
+            sink.close()
+
+    orphans = []
+    if args.prune and index is not None:
+        orphans = find_orphans(index, selector, args.shard)
+        # The state is not loaded on a full refresh, but must still forget
+        # pruned files (sharded runs forget them in dbtgen merge)
+        if args.run and not state and orphans and not args.shard:
+            state = State(params.STATE_FILE_PATH, params.PROJECT_ROOT)
+        prune_models(orphans, args.run, index, state)
+
+    # Shards may share the working tree, so rather than each overwriting the
+    # state and ownership index, their entries are recorded in the manifest
+    # and applied by dbtgen merge
+    if not args.shard:
+        if state:
+            state.save()
+        if args.run and index is not None:
+            index.save()
+
+    else:
+        manifest = args.shard_manifest or manifest_path(
+            params.SHARDS_DIR, 'model', args.shard
+        )
+        write_manifest(
+            manifest,
+            'model',
+            args.shard,
+            run_counts if args.run else {'compiled': len(outputs)},
+            outputs,
+            state={
+                key: state.models[key] for key in outputs
+                if key in state.models
+            } if state else {},
+            owners={
+                key: index.outputs[key] for key in outputs
+                if key in index.outputs
+            } if args.run and index is not None else {},
+            pruned=[
+                os.path.relpath(file_path, params.PROJECT_ROOT)
+                for file_path in orphans
+            ] if args.run else []
+        )
+        logger.info(f"Shard {args.shard[0]}/{args.shard[1]} manifest written "
+                    f"to {manifest}")
+
+    log_summary(args.run, run_counts, progress)
+
+    if args.prune and args.run:
+        logger.info(f"Models pruned: {len(orphans)}")
+    elif args.prune:
+        logger.info(f"Models orphaned: {len(orphans)}")
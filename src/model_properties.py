@@ -5,9 +5,13 @@ import snowflake.connector
 import yaml
 # from dbt.utils import deep_merge
 
+from . import params
 from .libs import node, profile
 from .libs.file_handler import list_files_in_dir
 from .libs.logger import CustomLogger
+from .libs.query import CHUNK_SIZE, PARALLEL_QUERIES, execute_chunked
+from .libs.sink import FileSystemSink, create_sink
+from .libs.tracer import tracer
 from .libs.yaml_handler import BaseDumper
 
 logger = CustomLogger()
@@ -42,8 +46,19 @@ def get_recency(
         target_schema: str,
         updated_at_field: str,
         use_tables: bool = False,
-        use_views: bool = False
-) -> dict:
+        use_views: bool = False,
+        chunk_size: int = CHUNK_SIZE,
+        parallel: int = PARALLEL_QUERIES,
+        timeout: float = None
+) -> list:
+    """
+    Finds the number of days since each table or view in a schema was last
+    updated. The objects are queried in chunks of chunk_size (see
+    execute_chunked); objects in a chunk which fails are reported, and
+    returned with a recency of None.
+
+    :returns: (model, recency in days) rows
+    """
 
     use_objects = []
 
@@ -89,20 +104,41 @@ def get_recency(
         try:
             logger.info(f'Finding models in: {target_schema.upper()}')
 
-            cur.execute(query__show_objects())
-            models = cur.execute(query__filter_objects()).fetchall()
+            with tracer.span('show_objects', 'query', schema=target_schema):
+                cur.execute(query__show_objects())
+                models = cur.execute(query__filter_objects()).fetchall()
             if not models:
                 logger.warn('[WARNING] No models found')
                 sys.exit(1)
 
-            logger.status('Calculating data recency', 'RUN')
-            recency = cur.execute(query__get_recency(models)).fetchall()
-            logger.status('Calculating data recency', 'DONE')
-
         except snowflake.connector.errors.ProgrammingError as err:
             logger.error(err.msg)
             sys.exit(1)
 
+    logger.status('Calculating data recency', 'RUN')
+    with tracer.span('get_recency', 'query', schema=target_schema,
+                     objects=len(models)):
+        recency, failures = execute_chunked(
+            con,
+            query__get_recency,
+            models,
+            chunk_size,
+            parallel,
+            timeout,
+            failed_rows=lambda objects: [
+                (f'{obj[1]}_{obj[2]}'.lower(), None) for obj in objects
+            ],
+            sort_key=lambda row: row[0]
+        )
+
+    for objects, error in failures:
+        for obj in objects:
+            logger.status(f'{obj[1]}.{obj[2]}: {error}', 'FAILED')
+    logger.status(
+        'Calculating data recency',
+        'FAILED' if failures else 'DONE'
+    )
+
     return recency
 
 
@@ -206,7 +242,8 @@ def generate_schema_tests(
 
 def generate_model_properties(
     model_properties: dict, 
-    model_properties_file_path: str
+    model_properties_file_path: str,
+    sink: FileSystemSink = None
 ):
 
     # TODO: Read existing yaml file and merge contents
@@ -223,14 +260,16 @@ def generate_model_properties(
         f'.dbtgen__{os.path.basename(model_properties_file_path)}'
     )
 
-    with open(output_path, 'w') as models_file:
+    sink = sink or FileSystemSink()
+    sink.write(
+        output_path,
         yaml.dump(
             model_properties,
-            models_file,
             Dumper=BaseDumper,
             default_flow_style=False, 
             sort_keys=False
         )
+    )
 
 
 def main(args):
@@ -244,7 +283,10 @@ def main(args):
         target_schema,
         args.updated_at_field,
         args.use_tables,
-        args.use_views
+        args.use_views,
+        args.chunk_size,
+        args.parallel_queries,
+        args.query_timeout
     )
 
     logger.info("Generating model properties file")
@@ -259,9 +301,14 @@ def main(args):
         args.updated_at_field,
         args.warn_only
     )
-    generate_model_properties(
-        model_properties,
-        model_properties_file_path
-    )
+    sink = create_sink(args.sink, params.PROJECT_ROOT)
+    try:
+        generate_model_properties(
+            model_properties,
+            model_properties_file_path,
+            sink
+        )
+    finally:
+        sink.close()
 
     logger.status(node.namespace(model_properties_file_path), 'DONE')
@@ -4,6 +4,8 @@ from os import listdir, path, walk
 from . import params
 from .libs import node
 from .libs.logger import CustomLogger
+from .libs.shard import in_shard, manifest_path, write_manifest
+from .libs.sink import FileSystemSink, create_sink
 from .libs.source import SourceFactory
 
 logger = CustomLogger()
@@ -11,8 +13,24 @@ logger = CustomLogger()
 
 def generate_sources(
     input_models_dir: str, 
-    output_sources_dir: str
-):
+    output_sources_dir: str,
+    shard: tuple = None,
+    sink: FileSystemSink = None
+) -> dict:
+    """
+    Creates a sources file for each model properties file
+
+    :param input_models_dir: Path to the dbt models directory
+    :param output_sources_dir: Path to the package sources directory
+    :param shard: Shard index and number of shards. Only the properties 
+        files belonging to the shard are processed
+    :param sink: Where the sources files are written (by default, the 
+        working tree)
+    :returns: Status of each sources file, by path relative to the project 
+        root
+    """
+
+    outputs = {}
 
     for root, sub_dirs, files in walk(input_models_dir):
         for sub_dir in sub_dirs:
@@ -30,6 +48,13 @@ def generate_sources(
 
                     source_db_suffix = path.basename(root)
                     model_properties_path = path.join(sub_dir_path, file)
+
+                    if not in_shard(
+                            path.relpath(model_properties_path,
+                                         params.PROJECT_ROOT),
+                            shard):
+                        continue
+
                     log_source_target = f"{node.namespace(sub_dir_path)}.yml"
                     
                     logger.status(log_source_target, "RUN")
@@ -44,19 +69,46 @@ def generate_sources(
                                  f"{source_db_suffix.upper()}"
                     )
                     src.from_model_properties(model_properties_path)
-                    src.source.write(sources_dir, overwrite=True)
+                    file_path, status = src.source.write(
+                        sources_dir,
+                        overwrite=True,
+                        sink=sink
+                    )
+                    outputs[path.relpath(file_path, params.PROJECT_ROOT)] = \
+                        status
 
-                    logger.status(log_source_target, "CREATED")
+    return outputs
 
 
 def main(args):
 
     logger.info("Creating dbt source files in .export/sources/")
 
-    # cleanup target directory
-    shutil.rmtree(params.TARGET_PACKAGE_SOURCES_DIR, ignore_errors=True)   
+    sink = create_sink(args.sink, params.PROJECT_ROOT)
 
-    generate_sources(
-        params.TARGET_MODELS_DIR,
-        params.TARGET_PACKAGE_SOURCES_DIR
-    )
+    # cleanup target directory
+    # (unless sharded, as other shards write to the same directory)
+    if sink.persistent and not args.shard:
+        shutil.rmtree(params.TARGET_PACKAGE_SOURCES_DIR, ignore_errors=True)   
+
+    try:
+        outputs = generate_sources(
+            params.TARGET_MODELS_DIR,
+            params.TARGET_PACKAGE_SOURCES_DIR,
+            args.shard,
+            sink
+        )
+    finally:
+        sink.close()
+
+    if args.shard:
+        counts = {}
+        for status in outputs.values():
+            counts[status.lower()] = counts.get(status.lower(), 0) + 1
+
+        manifest = args.shard_manifest or manifest_path(
+            params.SHARDS_DIR, 'package', args.shard
+        )
+        write_manifest(manifest, 'package', args.shard, counts, outputs)
+        logger.info(f"Shard {args.shard[0]}/{args.shard[1]} manifest written "
+                    f"to {manifest}")
@@ -4,6 +4,11 @@ MODULE_DIR = path.dirname(path.realpath(__file__))
 PROJECT_ROOT = path.abspath(getcwd())
 
 INPUT_MODELS_DIR = f'{getcwd()}/.dbtgen/'
+STATE_FILE_PATH = path.join(INPUT_MODELS_DIR, '.state.json')
+OUTPUTS_INDEX_PATH = path.join(INPUT_MODELS_DIR, '.outputs.json')
+SOCKET_PATH = path.join(INPUT_MODELS_DIR, '.serve.sock')
+YAML_CACHE_DIR = path.join(INPUT_MODELS_DIR, '.cache', 'yaml')
+SHARDS_DIR = path.join(INPUT_MODELS_DIR, '.shards')
 TARGET_MODELS_DIR = path.abspath(f'{PROJECT_ROOT}/models')
 TARGET_SOURCES_DIR = path.abspath(f'{PROJECT_ROOT}/sources')
 TARGET_PACKAGE_SOURCES_DIR = path.abspath(f'{PROJECT_ROOT}/.export/sources/')
@@ -0,0 +1,279 @@
+"""
+    Serves render, compile and diff requests over a Unix domain socket, so
+    that editor integrations and pre-commit hooks do not pay for starting
+    dbtgen and scanning the .dbtgen tree on every check.
+
+    The scanned models, compiled templates and resolved models.yml files are
+    kept in memory. Before each request, changes to the .dbtgen tree (from
+    the watcher) invalidate only the directories containing them.
+
+    Requests and responses are JSON objects, one per line:
+
+        {"command": "render", "model": "staging.stg_account"}
+        {"command": "compile", "select": "staging", "exclude": null}
+        {"command": "diff", "select": "staging"}
+
+    Every response has an "ok" key, and an "error" message if it failed.
+    Each connection is served by its own thread, so a client which keeps its
+    connection open does not block others. Requests are answered one at a
+    time, as they share the cache.
+"""
+
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+from . import model as models
+from . import params
+from .libs.logger import CustomLogger
+from .libs.ownership import OwnershipIndex
+from .libs.selector import Selector
+from .libs.watcher import create_watcher
+
+logger = CustomLogger()
+
+
+class ModelCache:
+    """
+    The models of the .dbtgen tree, by the namespace of the directory they
+    are generated in. Directories are only scanned again once files within
+    them change.
+
+    :param watcher: Watcher of the .dbtgen tree
+    """
+
+    def __init__(self, watcher):
+        self.watcher = watcher
+        self.models = None
+
+    @staticmethod
+    def _namespace(model: models.Model) -> str:
+        rel_dir = os.path.relpath(
+            os.path.dirname(model.dependencies[0]),
+            params.INPUT_MODELS_DIR
+        )
+        return '' if rel_dir == '.' else rel_dir.replace(os.sep, '.')
+
+    def _scan(self, namespace: str = None) -> None:
+        for model in models.find_models(within=namespace):
+            self.models.setdefault(self._namespace(model), []).append(model)
+
+    def refresh(self) -> None:
+        """
+        Scans the directories changed since the last request (or the whole
+        tree, on the first request)
+        """
+
+        if self.models is None:
+            # Changes made during the scan are picked up by the next request
+            self.watcher.changes(timeout=0)
+            self.models = {}
+            self._scan()
+            return
+
+        for namespace in models.changed_namespaces(self.watcher.changes(0)):
+            if namespace is None:
+                self.models = {}
+                self._scan()
+                return
+
+            for cached in list(self.models):
+                if cached == namespace or cached.startswith(namespace + '.'):
+                    del self.models[cached]
+            self._scan(namespace)
+
+    def select(self, selector: Selector) -> list:
+        """
+        Returns the selected models, ordered by output path
+        """
+
+        self.refresh()
+
+        return sorted(
+            (
+                model
+                for namespace_models in self.models.values()
+                for model in namespace_models
+                if selector.matches(model.full_name)
+            ),
+            key=lambda model: model.output_path
+        )
+
+
+def rendered(model: models.Model) -> dict:
+    result = {
+        'name': model.full_name,
+        'path': model.output_path,
+        'contents': model.contents
+    }
+    model.clear_contents()
+
+    return result
+
+
+def render(cache: ModelCache, request: dict) -> dict:
+    name = request.get('model')
+    if not name:
+        raise ValueError("A render request requires a 'model'")
+
+    for model in cache.select(Selector(name)):
+        if model.full_name == name:
+            return rendered(model)
+
+    raise ValueError(f"Model '{name}' not found")
+
+
+def compile_models(cache: ModelCache, request: dict) -> dict:
+    selected = cache.select(
+        Selector(request.get('select'), request.get('exclude'))
+    )
+
+    return {'models': [rendered(model) for model in selected]}
+
+
+def diff_models(cache: ModelCache, request: dict) -> dict:
+    selector = Selector(request.get('select'), request.get('exclude'))
+    results = []
+
+    for model in cache.select(selector):
+        status, diff = models.diff_model(model)
+        results.append({
+            'name': model.full_name,
+            'path': model.output_path,
+            'status': status,
+            'diff': ''.join(diff)
+        })
+        model.clear_contents()
+
+    index = OwnershipIndex(params.OUTPUTS_INDEX_PATH, params.PROJECT_ROOT)
+    orphans = models.find_orphans(index, selector)
+
+    return {
+        'models': results,
+        'orphaned': [
+            os.path.relpath(file_path, params.PROJECT_ROOT)
+            for file_path in orphans
+        ]
+    }
+
+
+COMMANDS = {
+    'render': render,
+    'compile': compile_models,
+    'diff': diff_models
+}
+
+
+class Server(socketserver.ThreadingUnixStreamServer):
+    """
+    Serves each connection from a thread, sharing one cache of the models
+
+    :param socket_path: Path of the Unix socket to listen on
+    :param cache: Models of the .dbtgen tree
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, cache: ModelCache):
+        super().__init__(socket_path, RequestHandler)
+        self.cache = cache
+        self.lock = threading.Lock()
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Answers each line of a connection as a request
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+
+            start = time.monotonic()
+            name = None
+
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError('Requests must be JSON objects')
+
+                name = request.get('command')
+                command = COMMANDS.get(name)
+                if command is None:
+                    raise ValueError(
+                        f"Unknown command '{name}'. Use one of "
+                        f"{', '.join(COMMANDS)}"
+                    )
+                with self.server.lock:
+                    result = command(self.server.cache, request)
+                response = {'ok': True, **result}
+                status = 'DONE'
+
+            # Any error (e.g. an invalid template or models.yml) is reported
+            # to the client, rather than dropping the connection
+            except Exception as e:
+                response = {'ok': False, 'error': f'{type(e).__name__}: {e}'}
+                status = 'FAILED'
+
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+            logger.status(
+                f"{name} ({(time.monotonic() - start) * 1000:.1f} ms)",
+                status
+            )
+
+
+def is_running(socket_path: str) -> bool:
+    """
+    Whether a server is already listening on a socket. A socket file left
+    behind by a server which did not shut down cleanly is removed.
+    """
+
+    if not os.path.exists(socket_path):
+        return False
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(socket_path)
+            return True
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.remove(socket_path)
+            return False
+
+
+def main(args):
+
+    socket_path = args.socket or params.SOCKET_PATH
+
+    if is_running(socket_path):
+        logger.status(f"dbtgen is already serving on {socket_path}", 'FAILED')
+        sys.exit(1)
+
+    watcher = create_watcher(params.INPUT_MODELS_DIR)
+    server = Server(socket_path, ModelCache(watcher))
+
+    logger.info("Scanning models")
+    server.cache.refresh()
+    logger.info(f"Serving on {socket_path} (press Ctrl+C to stop)")
+
+    # Clean up the socket when stopped by a service manager, as on Ctrl+C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    try:
+        server.serve_forever()
+
+    except KeyboardInterrupt:
+        logger.info("Stopped serving")
+
+    finally:
+        server.server_close()
+        watcher.close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
@@ -4,7 +4,11 @@ import snowflake.connector
 
 from .libs import node, profile, source
 from .libs.logger import CustomLogger
-from .params import SOURCE_DB_SELECTION_MAPPING, TARGET_SOURCES_DIR
+from .libs.query import CHUNK_SIZE, PARALLEL_QUERIES, execute_chunked
+from .libs.sink import create_sink
+from .libs.tracer import tracer
+from .params import (PROJECT_ROOT, SOURCE_DB_SELECTION_MAPPING,
+                     TARGET_SOURCES_DIR)
 
 """
     Generated dbt source files
@@ -20,8 +24,17 @@ def get_snowflake_tables(
         loaded_at_field: str = None,
         get_freshness: bool = False,
         use_tables: bool = True,
-        use_views: bool = False
+        use_views: bool = False,
+        chunk_size: int = CHUNK_SIZE,
+        parallel: int = PARALLEL_QUERIES,
+        timeout: float = None
     ) -> list:
+    """
+    Finds the tables (and views) in a database, and optionally their average
+    freshness. Freshness is queried in chunks of chunk_size objects (see
+    execute_chunked); objects in a chunk which fails are reported, and
+    returned with a freshness of None.
+    """
 
     use_objects = []
 
@@ -78,24 +91,50 @@ def get_snowflake_tables(
         try:
             logger.info(f'Finding sources in: {database.upper()}')
 
-            cur.execute(query__show_objects())
-            src_objects = cur.execute(query__filter_objects()).fetchall()
+            with tracer.span('show_objects', 'query', database=database):
+                cur.execute(query__show_objects())
+                src_objects = cur.execute(query__filter_objects()).fetchall()
 
             if not src_objects:
                 logger.warn('[WARNING] No sources found')
                 sys.exit(1)
 
-            if get_freshness:
-                logger.status('Calculating source freshness', 'RUN')
-                src_objects_with_freshness = \
-                    cur.execute(query__get_recency(src_objects)).fetchall()
-                logger.status('Calculating source freshness', 'DONE')
-
         except snowflake.connector.errors.ProgrammingError as err:
             logger.error(err.msg)
             sys.exit(1)
 
-    return src_objects_with_freshness if get_freshness else src_objects
+    if not get_freshness:
+        return src_objects
+
+    logger.status('Calculating source freshness', 'RUN')
+    with tracer.span('get_freshness', 'query', database=database,
+                     objects=len(src_objects)):
+        src_objects_with_freshness, failures = execute_chunked(
+            con,
+            query__get_recency,
+            src_objects,
+            chunk_size,
+            parallel,
+            timeout,
+            snowflake.connector.DictCursor,
+            failed_rows=lambda objects: [
+                {**obj, 'avg_freshness_in_days': None} for obj in objects
+            ],
+            sort_key=lambda row: (row['schema_name'], row['name'])
+        )
+
+    for objects, error in failures:
+        for obj in objects:
+            logger.status(
+                f"{obj['schema_name']}.{obj['name']}: {error}",
+                'FAILED'
+            )
+    logger.status(
+        'Calculating source freshness',
+        'FAILED' if failures else 'DONE'
+    )
+
+    return src_objects_with_freshness
 
 
 def main(args):
@@ -114,6 +153,25 @@ def main(args):
     }
 
     sf_connection = profile.snowflake_connect(args.profile)
+    sink = create_sink(args.sink, PROJECT_ROOT)
+
+    try:
+        write_sources(args, all_src_dbs, selected_schema, sf_connection, sink)
+    finally:
+        sink.close()
+
+
+def write_sources(
+        args,
+        all_src_dbs: dict,
+        selected_schema: str,
+        sf_connection,
+        sink
+) -> None:
+    """
+    Queries the tables of each source database (in the selected schema, or
+    all schemas) and writes a source file per schema into the sink
+    """
 
     for db__key, db__config in all_src_dbs.items():
 
@@ -122,7 +180,10 @@ def main(args):
             database=db__config['database'], 
             schemas=selected_schema if selected_schema else '*',
             loaded_at_field=args.loaded_at_field,
-            get_freshness=args.get_freshness
+            get_freshness=args.get_freshness,
+            chunk_size=args.chunk_size,
+            parallel=args.parallel_queries,
+            timeout=args.query_timeout
         )
 
         sources_grouped_by_schema = {}
@@ -149,4 +210,7 @@ def main(args):
             )
 
             src.write(
-                f"{TARGET_SOURCES_DIR}/{db__key}/", overwrite=args.overwrite)
+                f"{TARGET_SOURCES_DIR}/{db__key}/", 
+                overwrite=args.overwrite,
+                sink=sink
+            )